@@ -1,14 +1,112 @@
-from flask import Flask, render_template, request, redirect, url_for, session
-from etl.get_schedule import Schedule
-from etl.utils import validate_login_code, get_unique_names
+from flask import (
+    Flask,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    session,
+    jsonify,
+    g,
+    before_render_template,
+    template_rendered,
+)
+from etl.amion import validate_login_code, split_login_codes
 from forms import AccessCodeForm
 import datetime as dt
-import numpy as np
+import hashlib
+import importlib
+import logging
+import threading
+import time
+import requests
 from defaults.constants import Constants
+from etl.prefetch import PrefetchWorker
+from etl.selections import SelectionStore
+from etl import metrics
+
+# The pandas-backed ETL (etl.get_schedule, etl.utils) is imported inside the routes that
+# use it, so the home page and access code form are served before it finishes loading
+constants = Constants()
+HOURS = list(range(24))
+# Hours the start and end time filters offer, as they come in from forms and query strings
+FILTER_HOURS = {str(hour) for hour in constants.possible_hours.values()}
+
+logging.basicConfig(
+    level=constants.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "tylers-secret-key"
-print("\n========== NEW SESSION ==========")
+# Keep availabilities in date order in JSON responses
+app.json.sort_keys = False
+logger.info("========== NEW SESSION ==========")
+
+prefetch_worker = PrefetchWorker()
+if constants.prefetch_enabled:
+    prefetch_worker.start()
+
+
+def register_prefetch(access_code: str) -> None:
+    """Has the prefetch worker keep an access code from a URL cached, once it checks out"""
+    if not constants.prefetch_enabled:
+        return
+    try:
+        is_valid = validate_login_code(login_code=access_code)
+    except requests.RequestException as e:
+        logger.warning("could not check access code %s for prefetching: %s", access_code, e)
+        return
+    if is_valid:
+        prefetch_worker.register(access_code)
+
+
+def filter_hour(value) -> int:
+    """Hour of a start or end time filter, raises ValueError for hours the filter doesn't offer"""
+    if str(value) not in FILTER_HOURS:
+        raise ValueError(f"{value!r} is not an hour from 0 to 24")
+    return int(value)
+
+
+# Load the ETL in the background, so it is usually ready by the time the filter page asks
+if constants.preload_etl:
+    threading.Thread(
+        target=importlib.import_module, args=("etl.get_schedule",), name="preload", daemon=True
+    ).start()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request_time(response):
+    if "request_started" in g:
+        metrics.request_seconds.observe(
+            time.perf_counter() - g.request_started,
+            endpoint=request.endpoint or "unknown",
+            status=response.status_code,
+        )
+    return response
+
+
+@before_render_template.connect_via(app)
+def start_render_timer(sender, template, context, **extra):
+    g.render_started = time.perf_counter()
+
+
+@template_rendered.connect_via(app)
+def observe_render_time(sender, template, context, **extra):
+    if "render_started" in g:
+        metrics.stage_seconds.observe(
+            time.perf_counter() - g.pop("render_started"), stage="render_template"
+        )
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Stage timings, request timings and cache hit/miss counters in Prometheus format"""
+    return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -16,10 +114,12 @@ def homepage():
     form = AccessCodeForm()
     error_message = ""
     if form.is_submitted():
-        access_code = request.form.get("accesscode").lower()
+        # Several programs can be combined as comma-separated access codes
+        access_code = ",".join(split_login_codes(request.form.get("accesscode").lower()))
         session["access_code"] = access_code
-        print(f"ACCESS_CODE: {access_code}")
+        logger.info("ACCESS_CODE: %s", access_code)
         if validate_login_code(login_code=access_code):
+            prefetch_worker.register(access_code)
             return redirect(url_for("filter", access_code=access_code, staff_type="All"))
         error_message = f"The access code {access_code} is not a valid Amion Access Code"
 
@@ -28,13 +128,18 @@ def homepage():
 
 @app.route("/filter/access_code=<access_code>&staff_type=<staff_type>", methods=["GET", "POST"])
 def filter(access_code, staff_type):
+    from etl.utils import get_unique_names
+
+    register_prefetch(access_code)
     # Set defaults
     start_date = dt.date.today().strftime("%Y-%m-%d")
     end_date = (dt.date.today() + dt.timedelta(14)).strftime("%Y-%m-%d")
     name_options = get_unique_names(
         login_code=access_code,
         start_date=start_date,
-        end_date=(dt.date.today() + dt.timedelta(90)).strftime("%Y-%m-%d"),
+        end_date=(dt.date.today() + dt.timedelta(constants.name_directory_days)).strftime(
+            "%Y-%m-%d"
+        ),
         staff_types=staff_type,
     )
     name_err_message = ""
@@ -57,12 +162,9 @@ def filter(access_code, staff_type):
             end_date = request.form["end_date"]
             end_date_dt = dt.datetime.strptime(end_date, "%Y-%m-%d")
             names = request.form.getlist("names")
-            session["start_date"] = start_date
-            session["end_date"] = end_date
-            session["selected_names"] = names
-            print(f"start_date: {start_date}")
-            print(f"end_date: {end_date}")
-            print(f"selected_names: {names}")
+            logger.info(
+                "start_date: %s, end_date: %s, selected_names: %s", start_date, end_date, names
+            )
             if start_date_dt >= end_date_dt:
                 date_err_message = "Start date must be before end date"
                 err_ct += 1
@@ -70,14 +172,15 @@ def filter(access_code, staff_type):
                 name_err_message = "Please select at least 1 person"
                 err_ct += 1
             if err_ct == 0:
-                selected_names_str = "&".join(names).replace(",", "").replace(" ", "")
+                # Only the selection's short ID travels in the URL
+                selection_id = SelectionStore().save(
+                    login_code=access_code, names=names, start_date=start_date, end_date=end_date
+                )
                 return redirect(
                     url_for(
                         "availability",
                         access_code=access_code,
-                        start_date=start_date,
-                        end_date=end_date,
-                        selected_names_str=selected_names_str,
+                        selection_id=selection_id,
                         staff_type=staff_type,
                     )
                 )
@@ -90,22 +193,41 @@ def filter(access_code, staff_type):
         date_err_message=date_err_message,
         name_err_message=name_err_message,
         staff_type=staff_type,
-        possible_staff_types=Constants().allowed_staff_types,
+        possible_staff_types=constants.allowed_staff_types,
     )
 
 
 @app.route(
-    "/availability/access_code=<access_code>&start_date=<start_date>&end_date=<end_date>&names=<selected_names_str>&staff_type=<staff_type>",
+    "/availability/access_code=<access_code>&selection=<selection_id>&staff_type=<staff_type>",
     methods=["GET", "POST"],
 )
-def availability(access_code, start_date, end_date, selected_names_str, staff_type):
-    names = session.get("selected_names", None)
+def availability(access_code, selection_id, staff_type):
+    from etl.get_schedule import Schedule
+
+    register_prefetch(access_code)
+    selection = SelectionStore().load(selection_id)
+    if selection is None or selection["login_code"] != access_code:
+        # Expired or unknown selection, pick the names again
+        return redirect(url_for("filter", access_code=access_code, staff_type=staff_type))
+    names = selection["names"]
+    start_date = selection["start_date"]
+    end_date = selection["end_date"]
     start_time = 0
     end_time = 24
+    resolution = 60
 
     if request.method == "POST":
         start_time = request.form["start_time"]
         end_time = request.form["end_time"]
+        resolution = request.form.get("resolution", "60")
+        # Same checks as the JSON API, the form only offers valid values
+        try:
+            filter_hour(start_time), filter_hour(end_time)
+        except ValueError:
+            return "start_time and end_time must be hours from 0 to 24", 400
+        if resolution not in [str(minutes) for minutes in constants.possible_resolutions.values()]:
+            return "resolution must be one of 60, 30 or 15 minutes", 400
+        resolution = int(resolution)
 
     # Filter data and pass as args into html
     availabilities, final_relevant_names = Schedule().find_availability(
@@ -115,29 +237,316 @@ def availability(access_code, start_date, end_date, selected_names_str, staff_ty
         start_time=start_time,
         end_time=end_time,
         names=names,
+        resolution=resolution,
+        selection_id=selection_id,
     )
 
     if len(availabilities) == 0:
-        return redirect(url_for("no_freetime", access_code=access_code, staff_type=staff_type))
+        return redirect(
+            url_for(
+                "no_freetime",
+                access_code=access_code,
+                staff_type=staff_type,
+                selection_id=selection_id,
+            )
+        )
 
     return render_template(
         "hourly_availability.html",
         access_code=access_code,
         availabilities=availabilities,
-        hours=list(np.arange(24)),
+        hours=HOURS,
         names=final_relevant_names,
         start_date=dt.datetime.strptime(start_date, "%Y-%m-%d").strftime("%B %-d"),
         end_date=dt.datetime.strptime(end_date, "%Y-%m-%d").strftime("%B %-d"),
-        possible_hours=Constants().possible_hours,
+        possible_hours=constants.possible_hours,
         start_time=int(start_time),
         end_time=int(end_time),
+        possible_resolutions=constants.possible_resolutions,
+        resolution=resolution,
         staff_type=staff_type,
     )
 
 
 @app.route(
-    "/no_freetime/access_code=<access_code>&staff_type=<staff_type>",
+    "/no_freetime/access_code=<access_code>&staff_type=<staff_type>&selection=<selection_id>",
     methods=["GET", "POST"],
 )
-def no_freetime(access_code, staff_type):
-    return render_template("no_freetime.html", access_code=access_code, staff_type=staff_type)
+def no_freetime(access_code, staff_type, selection_id):
+    from etl.get_schedule import Schedule
+
+    # Suggest the times most of the invite list can make instead
+    best_slots = []
+    selection = SelectionStore().load(selection_id)
+    names = selection["names"] if selection is not None else []
+    if len(names) > 1 and selection["login_code"] == access_code:
+        best_slots = Schedule().find_best_slots(
+            login_code=access_code,
+            start_date=selection["start_date"],
+            end_date=selection["end_date"],
+            names=names,
+            min_attendees=len(names) // 2 + 1,
+            top_k=5,
+        )
+    return render_template(
+        "no_freetime.html",
+        access_code=access_code,
+        staff_type=staff_type,
+        best_slots=best_slots,
+        invite_count=len(names),
+    )
+
+
+@app.route("/api/v1/names", methods=["GET"])
+def api_names():
+    """
+    Names on the upcoming schedule as JSON, for type-ahead on the filter page
+
+    Query args: access_code, and optionally staff_type (defaults to All), prefix to
+    match against the start of a name or any word in it, and limit.
+    """
+    from etl.utils import get_name_directory
+
+    access_code = request.args.get("access_code", "").lower()
+    staff_type = request.args.get("staff_type", "All")
+    prefix = request.args.get("prefix", "")
+
+    try:
+        limit = int(request.args.get("limit", constants.name_search_limit))
+    except ValueError:
+        return jsonify(error="limit must be an int"), 400
+    if access_code == "":
+        return jsonify(error="access_code is required"), 400
+
+    register_prefetch(access_code)
+    name_directory = get_name_directory(
+        login_code=access_code,
+        start_date=dt.date.today().strftime("%Y-%m-%d"),
+        end_date=(dt.date.today() + dt.timedelta(constants.name_directory_days)).strftime(
+            "%Y-%m-%d"
+        ),
+    )
+    if prefix == "":
+        names = name_directory.names(staff_type=staff_type)[:limit]
+    else:
+        names = name_directory.search(prefix=prefix, staff_type=staff_type, limit=limit)
+    return jsonify(access_code=access_code, staff_type=staff_type, prefix=prefix, names=names)
+
+
+@app.route("/api/v1/selections", methods=["POST"])
+def api_selections():
+    """
+    Saves a selection of people and dates and returns its short ID
+
+    JSON body: access_code, start_date, end_date (YYYY-MM-DD) and names. The ID can be
+    passed to /api/v1/availability as selection instead of the names and dates.
+    """
+    body = request.get_json(silent=True) or {}
+    access_code = str(body.get("access_code", "")).lower()
+    start_date = body.get("start_date", "")
+    end_date = body.get("end_date", "")
+    names = body.get("names", [])
+
+    try:
+        start_date_dt = dt.datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_dt = dt.datetime.strptime(end_date, "%Y-%m-%d")
+        names = [str(name) for name in names]
+    except (TypeError, ValueError):
+        return jsonify(error="start_date and end_date must be YYYY-MM-DD, names a list"), 400
+    if access_code == "" or len(names) == 0:
+        return jsonify(error="access_code and at least one of names are required"), 400
+    if start_date_dt >= end_date_dt:
+        return jsonify(error="Start date must be before end date"), 400
+
+    selection_id = SelectionStore().save(
+        login_code=access_code, names=names, start_date=start_date, end_date=end_date
+    )
+    return jsonify(selection=selection_id, expires_in=constants.selection_ttl_seconds), 201
+
+
+@app.route("/api/v1/availability", methods=["GET"])
+def api_availability():
+    """
+    Free time of the selected people as JSON
+
+    Query args: access_code, start_date, end_date (YYYY-MM-DD) and names (repeated), or
+    instead of those selection, the ID of a saved selection, and optionally start_time
+    and end_time (0-24) and resolution (minutes, defaults to 60). Responses carry a
+    strong ETag of the selected people's shifts and the query, so polling clients get a
+    304 until one of those shifts changes.
+    """
+    from etl.get_schedule import Schedule
+
+    access_code = request.args.get("access_code", "").lower()
+    start_date = request.args.get("start_date", "")
+    end_date = request.args.get("end_date", "")
+    names = request.args.getlist("names")
+    start_time = request.args.get("start_time", "0")
+    end_time = request.args.get("end_time", "24")
+    resolution = request.args.get("resolution", "60")
+    selection_id = request.args.get("selection")
+    if selection_id is not None:
+        selection = SelectionStore().load(selection_id)
+        if selection is None:
+            return jsonify(error=f"selection {selection_id} doesn't exist or expired"), 404
+        access_code = selection["login_code"]
+        start_date = selection["start_date"]
+        end_date = selection["end_date"]
+        names = selection["names"]
+
+    try:
+        start_date_dt = dt.datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_dt = dt.datetime.strptime(end_date, "%Y-%m-%d")
+        filter_hour(start_time), filter_hour(end_time)
+    except ValueError:
+        return jsonify(error="start_date and end_date must be YYYY-MM-DD, times must be 0-24"), 400
+    if resolution not in [str(minutes) for minutes in constants.possible_resolutions.values()]:
+        return jsonify(error="resolution must be one of 60, 30 or 15 minutes"), 400
+    if access_code == "" or len(names) == 0:
+        return jsonify(error="access_code and at least one of names are required"), 400
+    if start_date_dt >= end_date_dt:
+        return jsonify(error="Start date must be before end date"), 400
+
+    schedule = Schedule()
+    version = schedule.schedule_version(
+        login_code=access_code, start_date=start_date, end_date=end_date, names=names
+    )
+    query = [access_code, start_date, end_date, start_time, end_time, resolution] + names
+    etag = hashlib.sha1("\n".join([version] + query).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        availabilities, final_relevant_names = schedule.find_availability(
+            login_code=access_code,
+            start_date=start_date,
+            end_date=end_date,
+            start_time=start_time,
+            end_time=end_time,
+            names=names,
+            resolution=int(resolution),
+            selection_id=selection_id,
+        )
+        response = jsonify(
+            access_code=access_code,
+            start_date=start_date,
+            end_date=end_date,
+            start_time=int(start_time),
+            end_time=int(end_time),
+            resolution=int(resolution),
+            names=final_relevant_names,
+            availabilities=availabilities,
+        )
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+@app.route("/api/v1/availability/batch", methods=["POST"])
+def api_batch_availability():
+    """
+    Free time of many groups of people as JSON, computed in one pass
+
+    JSON body: access_code, start_date, end_date (YYYY-MM-DD) and groups, a list of
+    objects with names, and optionally label, start_time and end_time (0-24).
+    """
+    from etl.get_schedule import Schedule
+
+    body = request.get_json(silent=True) or {}
+    access_code = str(body.get("access_code", "")).lower()
+    start_date = body.get("start_date", "")
+    end_date = body.get("end_date", "")
+    groups = body.get("groups", [])
+
+    try:
+        start_date_dt = dt.datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_dt = dt.datetime.strptime(end_date, "%Y-%m-%d")
+        groups = [
+            {
+                "label": group.get("label", str(i)),
+                "names": list(group["names"]),
+                "start_time": filter_hour(group.get("start_time", 0)),
+                "end_time": filter_hour(group.get("end_time", 24)),
+            }
+            for i, group in enumerate(groups)
+        ]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return (
+            jsonify(
+                error="start_date and end_date must be YYYY-MM-DD, every group needs names "
+                "and times must be 0-24"
+            ),
+            400,
+        )
+    if access_code == "" or len(groups) == 0:
+        return jsonify(error="access_code and at least one group are required"), 400
+    if start_date_dt >= end_date_dt:
+        return jsonify(error="Start date must be before end date"), 400
+
+    results = Schedule().find_batch_availability(
+        login_code=access_code,
+        start_date=start_date,
+        end_date=end_date,
+        groups=groups,
+    )
+    return jsonify(
+        access_code=access_code,
+        start_date=start_date,
+        end_date=end_date,
+        groups=[
+            dict(group, names=final_relevant_names, availabilities=availabilities)
+            for group, (availabilities, final_relevant_names) in zip(groups, results)
+        ],
+    )
+
+
+@app.route("/api/v1/best_slots", methods=["GET"])
+def api_best_slots():
+    """
+    Time slots ranked by how many of the selected people are free, as JSON
+
+    Query args: access_code, start_date, end_date (YYYY-MM-DD), names (repeated), and
+    optionally duration (hours), min_attendees, top_k, start_time and end_time (0-24).
+    """
+    from etl.get_schedule import Schedule
+
+    access_code = request.args.get("access_code", "").lower()
+    start_date = request.args.get("start_date", "")
+    end_date = request.args.get("end_date", "")
+    names = request.args.getlist("names")
+
+    try:
+        start_date_dt = dt.datetime.strptime(start_date, "%Y-%m-%d")
+        end_date_dt = dt.datetime.strptime(end_date, "%Y-%m-%d")
+        options = {
+            option: int(request.args.get(option, default))
+            for option, default in [("duration", 1), ("min_attendees", 1), ("top_k", 10)]
+        }
+        options["start_time"] = filter_hour(request.args.get("start_time", "0"))
+        options["end_time"] = filter_hour(request.args.get("end_time", "24"))
+    except ValueError:
+        return (
+            jsonify(
+                error="start_date and end_date must be YYYY-MM-DD, options must be ints "
+                "and times must be 0-24"
+            ),
+            400,
+        )
+    if access_code == "" or len(names) == 0:
+        return jsonify(error="access_code and at least one of names are required"), 400
+    if start_date_dt >= end_date_dt:
+        return jsonify(error="Start date must be before end date"), 400
+
+    best_slots = Schedule().find_best_slots(
+        login_code=access_code,
+        start_date=start_date,
+        end_date=end_date,
+        names=names,
+        **options,
+    )
+    return jsonify(
+        access_code=access_code,
+        start_date=start_date,
+        end_date=end_date,
+        **options,
+        best_slots=best_slots,
+    )
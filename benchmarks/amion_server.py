@@ -0,0 +1,163 @@
+"""
+Local stand-in for the Amion 625c API
+
+Serves recorded payloads from a directory (one <login code>.txt file per program)
+or synthetic schedules, so the app and benchmarks can run without reaching Amion:
+
+    python -m benchmarks.amion_server --port 8625 --payloads recorded/
+    AMION_URL=http://127.0.0.1:8625/cgi-bin/ocs flask run
+
+Unknown login codes get Amion's "Bad password" page.
+"""
+
+import argparse
+import datetime as dt
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from benchmarks.fixtures import render_625c, synthetic_schedule
+from etl.utils import parse_625c
+
+BAD_PASSWORD = "Bad password\n"
+
+
+class AmionStandIn:
+    """
+    Threaded HTTP server answering 625c report requests
+
+    Args:
+        schedules: Dict of login code to raw schedule dataframe
+        latency: Float seconds to wait before answering every request
+        port: Int port to listen on, a free port if 0
+        error_rate: Float share of requests answered with a 500 error
+        fail_first: Int number of first requests answered with a 500 error
+        cut_off_first: Int number of first requests whose body stops halfway through
+    """
+
+    def __init__(
+        self,
+        schedules: dict,
+        latency: float = 0,
+        port: int = 0,
+        error_rate: float = 0,
+        fail_first: int = 0,
+        cut_off_first: int = 0,
+    ):
+        self.schedules = schedules
+        self.latency = latency
+        self.error_rate = error_rate
+        self.fail_first = fail_first
+        self.cut_off_first = cut_off_first
+        self.requests = []
+        # Most requests being answered at the same time
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stand_in._lock:
+                    stand_in.requests.append(self.path)
+                    failing = len(stand_in.requests) <= stand_in.fail_first
+                    cut_off = len(stand_in.requests) <= stand_in.cut_off_first
+                    stand_in._in_flight += 1
+                    stand_in.max_in_flight = max(stand_in.max_in_flight, stand_in._in_flight)
+                try:
+                    self.answer(failing, cut_off)
+                finally:
+                    with stand_in._lock:
+                        stand_in._in_flight -= 1
+
+            def answer(self, failing: bool, cut_off: bool):
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+                if failing or random.random() < stand_in.error_rate:
+                    self.send_error(500)
+                    return
+                body = stand_in.report(parse_qs(urlparse(self.path).query)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if cut_off:
+                    # Drop the connection before the promised Content-Length is sent
+                    self.wfile.write(body[: len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/cgi-bin/ocs"
+
+    def report(self, query: dict) -> str:
+        login_code = query.get("Lo", [""])[0]
+        if login_code not in self.schedules:
+            return BAD_PASSWORD
+        schedule = self.schedules[login_code]
+        if "Year" in query:
+            start = dt.date(int(query["Year"][0]), int(query["Month"][0]), int(query["Day"][0]))
+            end = start + dt.timedelta(int(query.get("Days", ["1"])[0]))
+            days = pd.to_datetime(schedule["date"], format="%m-%d-%y").dt.date
+            schedule = schedule[(days >= start) & (days < end)]
+        return render_625c(schedule, title=login_code)
+
+    def start(self) -> "AmionStandIn":
+        # A short poll interval so stop() returns quickly
+        threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        ).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_payloads(payload_dir: str) -> dict:
+    """Parses every recorded <login code>.txt 625c payload in a directory"""
+    schedules = {}
+    for file_name in sorted(os.listdir(payload_dir)):
+        if file_name.endswith(".txt"):
+            with open(f"{payload_dir}/{file_name}") as infile:
+                schedules[file_name[: -len(".txt")]] = parse_625c(infile.read().split("\n"))
+    return schedules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8625)
+    parser.add_argument("--payloads", default=None, help="directory of recorded payloads")
+    parser.add_argument("--login", default="demo", help="login code of the synthetic schedule")
+    parser.add_argument("--residents", type=int, default=60)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    if args.payloads:
+        schedules = load_payloads(args.payloads)
+    else:
+        schedules = {
+            args.login: synthetic_schedule(
+                residents=args.residents, days=args.days, start=dt.date.today()
+            )
+        }
+    stand_in = AmionStandIn(
+        schedules=schedules, latency=args.latency, port=args.port, error_rate=args.error_rate
+    )
+    print(f"serving {sorted(schedules)} at {stand_in.url}")
+    stand_in.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
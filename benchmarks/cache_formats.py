@@ -0,0 +1,56 @@
+"""
+Compares cache hit and write times of the schedule cache formats
+
+    python -m benchmarks.cache_formats --residents 100 --days 90
+"""
+
+import argparse
+import datetime as dt
+import os
+import tempfile
+import time
+
+from benchmarks.fixtures import synthetic_schedule
+from etl.cache import ScheduleCache
+from etl.serializers import HAS_PYARROW, SERIALIZERS
+
+
+def time_call(fn, repeat: int) -> float:
+    """Best wall time of repeat calls, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--residents", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    start = dt.date(2023, 8, 1)
+    schedule = synthetic_schedule(residents=args.residents, days=args.days, start=start)
+    days = [start + dt.timedelta(i) for i in range(args.days)]
+    print(f"{len(schedule)} rows, {args.residents} residents, {args.days} days")
+
+    for cache_format in SERIALIZERS:
+        if cache_format == "feather" and not HAS_PYARROW:
+            print(f"{cache_format:>8}: skipped, pyarrow is not installed")
+            continue
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ScheduleCache(cache_dir=cache_dir, cache_format=cache_format)
+            write_ms = time_call(lambda: cache.write("bench", days, schedule), args.repeat)
+            read_ms = time_call(lambda: cache.read("bench", days), args.repeat)
+            size = sum(os.path.getsize(cache.partition_path("bench", day)) for day in days)
+            print(
+                f"{cache_format:>8}: write {write_ms:8.1f} ms, "
+                f"hit {read_ms:8.1f} ms, {size / 1024:8.0f} KiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Times fetching a combined access code one program at a time and concurrently, against
+a local Amion stand-in with injected latency
+
+    python -m benchmarks.fan_out --programs 4 --latency 0.5
+"""
+
+import argparse
+import datetime as dt
+import os
+import tempfile
+import time
+
+from benchmarks.amion_server import AmionStandIn
+from benchmarks.fixtures import synthetic_schedule
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--programs", type=int, default=4)
+    parser.add_argument("--residents", type=int, default=60)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    start = dt.date.today()
+    schedules = {
+        f"program{i}": synthetic_schedule(
+            residents=args.residents, days=args.days, start=start, seed=i
+        )
+        for i in range(args.programs)
+    }
+    stand_in = AmionStandIn(schedules=schedules, latency=args.latency).start()
+    os.environ["AMION_URL"] = stand_in.url
+
+    # Imported after AMION_URL is set so the shared client points at the stand-in
+    from etl.utils import get_schedule_store
+
+    def fetch(login_code: str):
+        return get_schedule_store(
+            login_code=login_code,
+            start_year=start.year,
+            start_month=start.month,
+            start_day=start.day,
+            days=args.days,
+        )
+
+    try:
+        for mode in ["sequential", "concurrent"]:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                os.environ["CACHE_DIR"] = cache_dir
+                fetch_start = time.perf_counter()
+                if mode == "sequential":
+                    for login_code in schedules:
+                        store = fetch(login_code)
+                else:
+                    store = fetch(",".join(schedules))
+                elapsed = time.perf_counter() - fetch_start
+            print(
+                f"{mode:>10}: {elapsed * 1000:8.1f} ms for {args.programs} programs, "
+                f"{len(store.names)} names in the last store"
+            )
+    finally:
+        stand_in.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import datetime as dt
+import random
+
+import pandas as pd
+
+from etl.cache import SCHEDULE_COLS
+
+FIRST_NAMES = ["Alex", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie", "Avery", "Quinn"]
+LAST_NAMES = ["Nguyen", "Smith", "Garcia", "Patel", "Kim", "Johnson", "Lee", "Brown", "Davis"]
+SHIFTS = [("0700", "1700"), ("0800", "1200"), ("1300", "1700"), ("0700", "1900")]
+OVERNIGHT_SHIFTS = [("1900", "0700"), ("2100", "0800")]
+# Amion lists 24 hour shifts with the same start and end time
+LONG_SHIFTS = [("0700", "0700"), ("0800", "0800")]
+SPLIT_TEAMS = ["Team 4", "Team 5"]
+
+
+def synthetic_schedule(
+    residents: int = 100,
+    days: int = 90,
+    teams: int = 6,
+    start: dt.date = dt.date(2023, 8, 1),
+    seed: int = 0,
+    overnight_rate: float = 0.15,
+    long_shift_rate: float = 0.03,
+    split_team_rate: float = 0.05,
+) -> pd.DataFrame:
+    """
+    Builds a realistic raw Amion 625c schedule, as returned by request_amion
+
+    Args:
+        residents: Int number of people on the schedule
+        days: Int number of days to schedule
+        teams: Int number of teams
+        start: Date of the first day
+        seed: Int seed for the random generator
+        overnight_rate: Float share of shifts running past midnight
+        long_shift_rate: Float share of 24 hour shifts
+        split_team_rate: Float share of shifts on team 4/5, listed as one row per team
+
+    Returns:
+        Pandas dataframe of raw schedule
+    """
+    rnd = random.Random(seed)
+    names = [
+        f"{LAST_NAMES[i % len(LAST_NAMES)]}{i}, {FIRST_NAMES[i % len(FIRST_NAMES)]}"
+        for i in range(residents)
+    ]
+    staff_types = {name: f"PGY-{i % 3 + 1}" for i, name in enumerate(names)}
+    rows = []
+    for day in range(days):
+        date = (start + dt.timedelta(day)).strftime("%m-%d-%y")
+        for name in names:
+            if rnd.random() < 0.2:
+                continue
+            shift_kind = rnd.random()
+            if shift_kind < long_shift_rate:
+                start_time, end_time = rnd.choice(LONG_SHIFTS)
+            elif shift_kind < long_shift_rate + overnight_rate:
+                start_time, end_time = rnd.choice(OVERNIGHT_SHIFTS)
+            else:
+                start_time, end_time = rnd.choice(SHIFTS)
+            if rnd.random() < split_team_rate:
+                shift_teams = SPLIT_TEAMS
+            else:
+                shift_teams = [f"Team {rnd.randrange(1, teams + 1)}"]
+            grouping = rnd.choice(["On Call", "Clinic"])
+            for team in shift_teams:
+                rows.append([name, team, date, staff_types[name], start_time, end_time, grouping])
+    return pd.DataFrame(rows, columns=SCHEDULE_COLS)
+
+
+def render_625c(schedule: pd.DataFrame, title: str = "Synthetic Program") -> str:
+    """Renders a raw schedule back into the text of an Amion 625c report"""
+    header = [
+        f"Amion 625c report for {title}",
+        "Format 625c",
+        "",
+        "",
+        "",
+        "",
+        "Name,Id,Id,Team,Id,Id,Date,Start,End,Type,Pager,Tel,Email,,,,Grouping",
+    ]
+    lines = header + [
+        ",".join(
+            [
+                f'"{row.name}"',
+                str(i),
+                "",
+                f'"{row.team}"',
+                "",
+                "",
+                row.date,
+                row.start_time,
+                row.end_time,
+                row.staff_type,
+                "",
+                "",
+                "",
+                "",
+                "",
+                "",
+                row.grouping,
+            ]
+        )
+        for i, row in enumerate(schedule.itertuples(index=False))
+    ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,102 @@
+"""
+Checks the app's cold start against an import-time budget
+
+Imports app in a fresh interpreter with -X importtime and serves the home page through
+the test client, once in the deployed configuration, where a background thread
+preloads the ETL, and once with PRELOAD_ETL=0. Fails if either took longer than the
+budget, or if the home page loaded any of the analytics stack (pandas, numpy) when
+nothing preloads it:
+
+    python -m benchmarks.import_time --budget-ms 500
+
+tests/test_import_time.py runs the same checks.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+BUDGET_MS = 500
+HEAVY_MODULES = ["pandas", "numpy"]
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP = f"""
+import sys, time
+start = time.perf_counter()
+import app
+app.app.test_client().get("/")
+elapsed = time.perf_counter() - start
+print(elapsed * 1000)
+print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+
+def cold_start(preload: bool = None) -> tuple:
+    """
+    Milliseconds to import app and serve the home page, heavy modules and the profile
+
+    Args:
+        preload: Bool to set PRELOAD_ETL, the deployed default if None
+    """
+    env = dict(os.environ, PREFETCH_ENABLED="0", LOG_LEVEL="WARNING")
+    env.pop("PRELOAD_ETL", None)
+    if preload is not None:
+        env["PRELOAD_ETL"] = "1" if preload else "0"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        cwd=REPO_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # The last two lines printed, the second one is empty if no heavy module loaded
+    elapsed_ms, heavy = result.stdout.split("\n")[-3:-1]
+    return float(elapsed_ms), [name for name in heavy.split(",") if name], result.stderr
+
+
+def best_cold_start(preload: bool = None, repeat: int = 3) -> tuple:
+    """The fastest of repeat cold starts, as returned by cold_start"""
+    return min(cold_start(preload=preload) for _ in range(repeat))
+
+
+def top_level_imports(profile: str, top: int) -> list:
+    """(cumulative ms, module) of the slowest modules imported directly by app"""
+    imports = []
+    for line in profile.split("\n"):
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Modules imported by app itself are indented by three spaces
+        if name.startswith("   ") and not name.startswith("    ") and cumulative.strip().isdigit():
+            imports.append((int(cumulative) / 1000, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to show")
+    args = parser.parse_args()
+
+    failures = []
+    for preload, label in [(None, "default, ETL preloading"), (False, "PRELOAD_ETL=0")]:
+        elapsed_ms, heavy, profile = best_cold_start(preload=preload, repeat=args.repeat)
+        print(f"import app + GET / ({label}): {elapsed_ms:.0f} ms (best of {args.repeat})")
+        if elapsed_ms > args.budget_ms:
+            failures.append(f"{label} over the {args.budget_ms:.0f} ms budget")
+        if preload is False:
+            for cumulative_ms, name in top_level_imports(profile, args.top):
+                print(f"{cumulative_ms:8.1f} ms  {name}")
+            if heavy:
+                failures.append(f"loaded {', '.join(heavy)} before the first analytics request")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+"""
+Times every stage of the availability pipeline and the Flask routes across schedule sizes
+
+Each size gets a synthetic 625c schedule served by the local Amion stand-in and its
+own cache directory. Results are saved to JSON so runs can be compared:
+
+    python -m benchmarks.pipeline --residents 25,100,400 --days 30,90,365
+    python -m benchmarks.pipeline --compare benchmarks/results/pipeline-<before>.json
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.amion_server import AmionStandIn
+from benchmarks.fixtures import render_625c, synthetic_schedule
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def time_stage(fn, repeat: int) -> dict:
+    """Runs fn repeat times and returns its best and median wall times in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"best_ms": min(times), "median_ms": statistics.median(times)}
+
+
+def run_once(fn) -> dict:
+    """Times a stage that can only run once, like a cache miss"""
+    start = time.perf_counter()
+    fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    return {"best_ms": elapsed, "median_ms": elapsed}
+
+
+def bench_size(
+    client, stand_in: AmionStandIn, residents: int, days: int, n_names: int, repeat: int
+) -> list:
+    """Times every stage and route for one schedule size"""
+    # Imported here so the shared Amion client and the app pick up the stand-in's URL
+    from etl.get_schedule import Schedule, _busy_intervals
+    from etl.selections import SelectionStore
+    from etl.shared_cache import get_shared_cache
+    from etl.utils import get_schedule, get_schedule_store, parse_625c
+
+    login_code = f"bench{residents}x{days}"
+    # The filter page and names API look at the days from today
+    start = dt.date.today()
+    start_date = start.strftime("%Y-%m-%d")
+    end_date = (start + dt.timedelta(days)).strftime("%Y-%m-%d")
+    parsed = {"start_year": start.year, "start_month": start.month, "start_day": start.day}
+    schedule = synthetic_schedule(residents=residents, days=days, start=start)
+    stand_in.schedules[login_code] = schedule
+    names = sorted(set(schedule["name"]))[:n_names]
+    payload = render_625c(schedule, title=login_code).split("\n")
+    store_args = dict(login_code=login_code, days=days, **parsed)
+    window = dict(start_date=dt.datetime(start.year, start.month, start.day), days=days)
+
+    stages = {}
+    stages["parse_625c"] = time_stage(lambda: parse_625c(payload), repeat)
+    stages["get_schedule_miss"] = run_once(lambda: get_schedule(**store_args))
+    stages["get_schedule_hit"] = time_stage(lambda: get_schedule(**store_args), repeat)
+    store = get_schedule_store(**store_args)
+
+    schedule_obj = Schedule()
+    cleaned = schedule_obj.clean_schedule(schedule=store, names=names, **window)
+    stages["clean_schedule"] = time_stage(
+        lambda: schedule_obj.clean_schedule(schedule=store, names=names, **window), repeat
+    )
+    free_time_args = dict(schedule=cleaned, relevant_names=names, days=days, **parsed)
+    free_time, _ = schedule_obj.find_free_time(start_time=0, end_time=24, **free_time_args)
+    stages["find_free_time"] = time_stage(
+        lambda: schedule_obj.find_free_time(start_time=0, end_time=24, **free_time_args), repeat
+    )
+    formatted = schedule_obj.format_free_time(free_time)
+    stages["format_free_time"] = time_stage(
+        lambda: schedule_obj.format_free_time(free_time), repeat
+    )
+    stages["freetime_to_json"] = time_stage(
+        lambda: schedule_obj.freetime_to_json(formatted), repeat
+    )
+
+    def clear_results():
+        # Results are cached in this process and in the shared cache, so every repeat
+        # below computes them again instead of timing a cache hit
+        _busy_intervals.clear()
+        get_shared_cache().clear(prefix="availability:")
+
+    def find_availability(resolution: int, cached: bool = False):
+        if not cached:
+            clear_results()
+        schedule_obj.find_availability(
+            login_code=login_code,
+            start_date=start_date,
+            end_date=end_date,
+            names=names,
+            resolution=resolution,
+        )
+
+    stages["find_availability"] = time_stage(lambda: find_availability(60), repeat)
+    stages["find_availability_15min"] = time_stage(lambda: find_availability(15), repeat)
+    find_availability(60, cached=True)
+    stages["find_availability_hit"] = time_stage(lambda: find_availability(60, cached=True), repeat)
+
+    # End to end through the Flask routes, with the schedule already cached
+    selection_id = SelectionStore().save(
+        login_code=login_code, names=names, start_date=start_date, end_date=end_date
+    )
+    query = {"access_code": login_code, "start_date": start_date, "end_date": end_date}
+    routes = {
+        "route_filter": f"/filter/access_code={login_code}&staff_type=All",
+        "route_availability": (
+            f"/availability/access_code={login_code}&selection={selection_id}&staff_type=All"
+        ),
+        "route_api_availability": ("/api/v1/availability", dict(query, names=names)),
+        "route_api_best_slots": ("/api/v1/best_slots", dict(query, names=names)),
+        "route_api_names": ("/api/v1/names", {"access_code": login_code, "prefix": "a"}),
+    }
+    for stage, route in routes.items():
+        path, query_string = route if isinstance(route, tuple) else (route, None)
+
+        def get():
+            clear_results()
+            response = client.get(path, query_string=query_string)
+            assert response.status_code in [200, 302], (path, response.status_code)
+
+        get()
+        stages[stage] = time_stage(get, repeat)
+
+    return [
+        dict(residents=residents, days=days, rows=len(schedule), stage=stage, **timing)
+        for stage, timing in stages.items()
+    ]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(results: list, baseline_path: str) -> None:
+    """Prints the median time of every stage next to a previous run's"""
+    with open(baseline_path) as infile:
+        baseline = {
+            (row["residents"], row["days"], row["stage"]): row
+            for row in json.load(infile)["results"]
+        }
+    print(f"\n{'size':>10} {'stage':>24} {'before ms':>10} {'after ms':>10} {'ratio':>7}")
+    for row in results:
+        before = baseline.get((row["residents"], row["days"], row["stage"]))
+        if before is None:
+            continue
+        print(
+            f"{row['residents']:>4}x{row['days']:<5} {row['stage']:>24} "
+            f"{before['median_ms']:10.1f} {row['median_ms']:10.1f} "
+            f"{row['median_ms'] / max(before['median_ms'], 1e-9):7.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--residents", default="25,100,400", help="comma-separated sizes")
+    parser.add_argument("--days", default="30,90,365", help="comma-separated sizes")
+    parser.add_argument("--names", type=int, default=5, help="people to find free time for")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="defaults to benchmarks/results/")
+    parser.add_argument("--compare", default=None, help="results JSON of a previous run")
+    args = parser.parse_args()
+
+    stand_in = AmionStandIn(schedules={}).start()
+    cache_dir = tempfile.TemporaryDirectory()
+    os.environ["AMION_URL"] = stand_in.url
+    os.environ["CACHE_DIR"] = cache_dir.name
+    os.environ["PREFETCH_ENABLED"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    from app import app
+
+    client = app.test_client()
+    results = []
+    try:
+        for residents in [int(size) for size in args.residents.split(",")]:
+            for days in [int(size) for size in args.days.split(",")]:
+                size_results = bench_size(
+                    client, stand_in, residents, days, args.names, args.repeat
+                )
+                for row in size_results:
+                    print(
+                        f"{residents:>4}x{days:<5} {row['stage']:>24}: "
+                        f"best {row['best_ms']:9.1f} ms, median {row['median_ms']:9.1f} ms"
+                    )
+                results += size_results
+    finally:
+        stand_in.stop()
+        cache_dir.cleanup()
+
+    run = {
+        "meta": {
+            "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "repeat": args.repeat,
+            "names": args.names,
+        },
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(
+            RESULTS_DIR, f"pipeline-{dt.datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+        )
+    with open(output, "w") as outfile:
+        json.dump(run, outfile, indent=2)
+    print(f"saved {len(results)} results to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,106 @@
+import os
+
+POSSIBLE_HOURS = {
+    "12:00 AM": 0,
+    "1:00 AM": 1,
+    "2:00 AM": 2,
+    "3:00 AM": 3,
+    "4:00 AM": 4,
+    "5:00 AM": 5,
+    "6:00 AM": 6,
+    "7:00 AM": 7,
+    "8:00 AM": 8,
+    "9:00 AM": 9,
+    "10:00 AM": 10,
+    "11:00 AM": 11,
+    "12:00 PM": 12,
+    "1:00 PM": 13,
+    "2:00 PM": 14,
+    "3:00 PM": 15,
+    "4:00 PM": 16,
+    "5:00 PM": 17,
+    "6:00 PM": 18,
+    "7:00 PM": 19,
+    "8:00 PM": 20,
+    "9:00 PM": 21,
+    "10:00 PM": 22,
+    "11:00 PM": 23,
+    "11:59 PM": 24,
+}
+
+POSSIBLE_RESOLUTIONS = {
+    "1 hour": 60,
+    "30 minutes": 30,
+    "15 minutes": 15,
+}
+
+ALLOWED_STAFF_TYPES = ["PGY-1", "PGY-2", "PGY-3"]
+
+# _cache at the root of the repo
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "_cache"
+)
+
+
 class Constants:
     def __init__(self):
-        self.possible_hours = {
-            "12:00 AM": 0,
-            "1:00 AM": 1,
-            "2:00 AM": 2,
-            "3:00 AM": 3,
-            "4:00 AM": 4,
-            "5:00 AM": 5,
-            "6:00 AM": 6,
-            "7:00 AM": 7,
-            "8:00 AM": 8,
-            "9:00 AM": 9,
-            "10:00 AM": 10,
-            "11:00 AM": 11,
-            "12:00 PM": 12,
-            "1:00 PM": 13,
-            "2:00 PM": 14,
-            "3:00 PM": 15,
-            "4:00 PM": 16,
-            "5:00 PM": 17,
-            "6:00 PM": 18,
-            "7:00 PM": 19,
-            "8:00 PM": 20,
-            "9:00 PM": 21,
-            "10:00 PM": 22,
-            "11:00 PM": 23,
-            "11:59 PM": 24,
-        }
-
-        self.allowed_staff_types = ["PGY-1", "PGY-2", "PGY-3"]
+        # Shared tables, built once when the module loads
+        self.possible_hours = POSSIBLE_HOURS
+        self.possible_resolutions = POSSIBLE_RESOLUTIONS
+        self.allowed_staff_types = ALLOWED_STAFF_TYPES
+
+        # DEBUG also logs every availabilities dict returned
+        self.log_level = os.environ.get("LOG_LEVEL", "INFO")
+        # Import the pandas-backed ETL in the background as soon as the app starts
+        self.preload_etl = os.environ.get("PRELOAD_ETL", "1") == "1"
+
+        # Name options on the filter page and type-ahead search
+        self.name_directory_days = 90
+        self.name_search_limit = 20
+
+        # Amion API
+        self.amion_url = os.environ.get("AMION_URL", "http://www.amion.com/cgi-bin/ocs")
+        self.amion_connect_timeout = 3.05
+        self.amion_read_timeout = 30
+        self.amion_retries = 3
+        self.amion_backoff = 0.5
+        self.amion_pool_size = 10
+        # Most access codes or date chunks fetched at the same time
+        self.amion_max_concurrency = 4
+        # Long windows are fetched in chunks of this many days, failed chunks are retried
+        self.amion_chunk_days = 30
+        self.amion_chunk_retries = 1
+
+        # Access code validation
+        self.valid_login_ttl_seconds = 24 * 60 * 60
+        self.invalid_login_ttl_seconds = 5 * 60
+        self.login_check_cache_size = 4096
+
+        # Schedule cache
+        self.cache_dir = os.environ.get("CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.cache_format = "npy"  # npy, feather (needs pyarrow) or csv
+        self.cache_ttl_seconds = 6 * 60 * 60
+        self.cache_ttl_overrides = {}  # login code -> seconds
+        self.cache_max_bytes = 500 * 1024 * 1024
+        self.busy_intervals_cache_size = 256
+        # Parsed schedules kept in memory per worker, one per (combined) access code
+        self.schedule_store_cache_size = 64
+
+        # SQLite cache shared by every worker, shared.sqlite3 in the cache dir if None
+        self.shared_cache_path = os.environ.get("SHARED_CACHE_PATH")
+        self.shared_cache_ttl_seconds = 6 * 60 * 60
+        # A worker holds a key for at most this long, the others wait up to wait_seconds
+        self.shared_cache_lease_seconds = 60
+        self.shared_cache_wait_seconds = 90
+        self.shared_cache_poll_seconds = 0.05
+        # Server-side name selections referenced by short IDs in the URL
+        self.selection_ttl_seconds = 24 * 60 * 60
+
+        # Background prefetch of recently used access codes
+        self.prefetch_enabled = os.environ.get("PREFETCH_ENABLED", "1") == "1"
+        self.prefetch_interval_seconds = 5 * 60
+        self.prefetch_active_seconds = 24 * 60 * 60
+        self.prefetch_days = 90
+        self.prefetch_refresh_margin_seconds = 30 * 60
+        self.prefetch_max_workers = 2
+        self.prefetch_jitter_seconds = 30
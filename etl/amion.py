@@ -0,0 +1,247 @@
+import io
+import itertools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+import urllib3.exceptions
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from defaults.constants import Constants
+from etl.lru import LRUCache
+from etl.metrics import record_cache_lookup
+
+# Access code validation results, login code -> (is_valid, checked_at). Bounded, as the
+# keys come straight from the login form
+_login_code_checks = LRUCache(maxsize=Constants().login_check_cache_size)
+
+
+class AmionClient:
+    """
+    Shared HTTP client for the Amion API
+
+    Every call goes through one pooled keep-alive session with connect/read timeouts
+    and bounded retries with exponential backoff. Identical calls that are in flight
+    at the same time are coalesced, so only the first one reaches Amion and the rest
+    wait for its result. At most max_concurrency calls are open at once, however
+    many threads fan out over access codes and date chunks.
+    """
+
+    def __init__(
+        self,
+        base_url: str = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        retries: int = None,
+        backoff: float = None,
+        pool_size: int = None,
+        max_concurrency: int = None,
+    ):
+        constants = Constants()
+        self.base_url = base_url or constants.amion_url
+        self.timeout = (
+            connect_timeout or constants.amion_connect_timeout,
+            read_timeout or constants.amion_read_timeout,
+        )
+        retry = Retry(
+            total=constants.amion_retries if retries is None else retries,
+            backoff_factor=constants.amion_backoff if backoff is None else backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"],
+        )
+        pool_size = pool_size or constants.amion_pool_size
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Held for the whole call, streamed body included
+        self._slots = threading.BoundedSemaphore(max_concurrency or constants.amion_max_concurrency)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def url(
+        self,
+        login_code: str,
+        start_year: int = 0,
+        start_month: int = 0,
+        start_day: int = 0,
+        days: int = 0,
+    ) -> str:
+        """URL of the 625c report, the default report window if start_year is 0"""
+        url = f"{self.base_url}?Lo={login_code}&Rpt=625c"
+        if start_year != 0:
+            url = (
+                url
+                + f"&Day={str(start_day)}&Month={str(start_month)}&Year={str(start_year)}&Days={str(days)}"
+            )
+        return url
+
+    def get(self, url: str) -> requests.Response:
+        with self._slots:
+            response = self.session.get(url=url, timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    @contextmanager
+    def stream(self, url: str):
+        """
+        Opens a streamed call, its body has to be read inside the with block
+
+        The body is read straight from urllib3, so errors while reading it, like a
+        stalled or cut off body, are raised as the requests exceptions
+        Response.iter_content would raise.
+        """
+        with self._slots:
+            response = self.session.get(url=url, timeout=self.timeout, stream=True)
+            try:
+                response.raise_for_status()
+                yield response
+            except urllib3.exceptions.ProtocolError as e:
+                raise requests.exceptions.ChunkedEncodingError(e) from e
+            except urllib3.exceptions.DecodeError as e:
+                raise requests.exceptions.ContentDecodingError(e) from e
+            except urllib3.exceptions.SSLError as e:
+                raise requests.exceptions.SSLError(e) from e
+            except urllib3.exceptions.HTTPError as e:
+                raise requests.exceptions.ConnectionError(e) from e
+            finally:
+                response.close()
+
+    def coalesce(self, key, fetch):
+        """
+        Runs fetch once for every group of concurrent calls with the same key
+
+        Args:
+            key: Hashable identifying the call, usually the URL
+            fetch: Callable without arguments doing the actual call
+
+        Returns:
+            The result of fetch, shared by every caller waiting on the same key
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._in_flight[key] = future
+
+        if not is_owner:
+            return future.result()
+
+        try:
+            result = fetch()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> AmionClient:
+    """Returns the AmionClient shared by the whole process"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AmionClient()
+    return _client
+
+
+def response_lines(response: requests.Response):
+    """
+    Text lines of a streamed response, read as they arrive
+
+    Reads the raw stream through io.TextIOWrapper instead of iter_lines, which yields
+    an extra empty line when a chunk ends right on a newline. Lines keep their line
+    endings, as csv.reader expects.
+    """
+    # Let urllib3 undo gzip and deflate content encodings, and keep the stream open once
+    # the body is read so the wrapper sees the end of the file instead of a closed file
+    response.raw.decode_content = True
+    response.raw.auto_close = False
+    return io.TextIOWrapper(response.raw, encoding=response.encoding or "utf-8", newline="")
+
+
+def probe_login_code(login_code: str) -> bool:
+    """
+    Checks an access code against Amion by only reading the start of the 625c report
+
+    The "bad password" message shows up in the report header, so the connection is
+    closed once the header is read instead of downloading the whole report.
+    """
+    client = get_client()
+    url = client.url(login_code=login_code)
+
+    def probe():
+        with client.stream(url=url) as response:
+            header_lines = itertools.islice(response_lines(response), 8)
+            return "bad password" not in "".join(header_lines).lower()
+
+    return client.coalesce(("probe", url), probe)
+
+
+def split_login_codes(login_code: str) -> list:
+    """Access codes making up a combined access code like "chla,cho", without repeats"""
+    return list(dict.fromkeys(code.strip() for code in login_code.split(",") if code.strip()))
+
+
+def fan_out(fn, items: list) -> list:
+    """
+    Calls fn on every item at the same time, at most amion_max_concurrency at once
+
+    Nested calls, like chunks of dates fanned out inside every access code, each get
+    their own threads, but the shared client still keeps the Amion calls themselves
+    within amion_max_concurrency.
+
+    Args:
+        fn: Callable taking one item, like an access code or a chunk of dates
+        items: List of items
+
+    Returns:
+        List of the results of fn, in the order of items
+    """
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    max_workers = min(len(items), Constants().amion_max_concurrency)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(fn, items))
+
+
+def validate_login_code(login_code: str) -> bool:
+    """
+    Checks an access code, reusing recent results for the configured TTLs
+
+    A combined access code is valid if every access code in it is.
+    """
+    login_codes = split_login_codes(login_code)
+    if len(login_codes) != 1:
+        return len(login_codes) > 1 and all(fan_out(validate_login_code, login_codes))
+
+    login_code = login_codes[0]
+    constants = Constants()
+    check = _login_code_checks.get(login_code)
+    if check is not None:
+        is_valid, checked_at = check
+        if is_valid:
+            ttl = constants.valid_login_ttl_seconds
+        else:
+            ttl = constants.invalid_login_ttl_seconds
+        if time.time() - checked_at < ttl:
+            record_cache_lookup("login_code_check", hits=1)
+            return is_valid
+
+    record_cache_lookup("login_code_check", misses=1)
+    is_valid = probe_login_code(login_code=login_code)
+    _login_code_checks.put(login_code, (is_valid, time.time()))
+    return is_valid
@@ -0,0 +1,279 @@
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+# Minute of the day of 11:00 PM, where free_blocks ends every day's last block
+LAST_HOUR_START = 23 * 60
+
+
+def busy_matrix(
+    person_codes: np.ndarray,
+    start_minutes: np.ndarray,
+    end_minutes: np.ndarray,
+    n_people: int,
+    periods: int,
+) -> np.ndarray:
+    """
+    Builds a people x hours matrix of busy hours using interval arithmetic
+
+    Every shift marks the hours from its start through the hour containing its
+    end as busy (both ends inclusive), the same hours the old
+    pd.date_range(start, end, freq="H") expansion produced. Shifts that don't
+    start on the hour never line up with the hourly scope, so they mark nothing.
+
+    Args:
+        person_codes: Int row in the matrix for every shift
+        start_minutes: Int minutes between the start of the window and each shift start
+        end_minutes: Int minutes between the start of the window and each shift end
+        n_people: Int number of rows in the matrix
+        periods: Int number of hours in the window
+
+    Returns:
+        Boolean array of shape (n_people, periods), True where a person is working
+    """
+    person_codes = np.asarray(person_codes, dtype=np.int64)
+    start_minutes = np.asarray(start_minutes, dtype=np.int64)
+    end_minutes = np.asarray(end_minutes, dtype=np.int64)
+
+    first_hour = np.clip(start_minutes // 60, 0, periods)
+    last_hour = np.clip(end_minutes // 60 + 1, 0, periods)
+    valid = (start_minutes % 60 == 0) & (first_hour < last_hour)
+
+    # +1 where a shift starts and -1 after it ends, a running sum gives the shift count per hour
+    diff = np.zeros((n_people, periods + 1), dtype=np.int32)
+    np.add.at(diff, (person_codes[valid], first_hour[valid]), 1)
+    np.add.at(diff, (person_codes[valid], last_hour[valid]), -1)
+    return np.cumsum(diff[:, :-1], axis=1) > 0
+
+
+def hour_mask(hours: np.ndarray, start_time: int, end_time: int) -> np.ndarray:
+    """True for every hour of the day that falls inside the selected start and end time"""
+    return (hours >= start_time) & (hours <= end_time)
+
+
+def free_blocks(free_time: np.ndarray) -> list:
+    """
+    Run-length encodes an hourly free/busy vector into the free blocks shown on the site
+
+    Blocks are split at day boundaries. Every day is cut at 12:00 AM, at 11:00 PM and
+    at every hour where the free/busy status changes, and a block runs from one cut to
+    the next. A block that reaches 11:00 PM is displayed as ending at 11:59 PM.
+
+    Args:
+        free_time: Boolean array with one entry per hour, starting at midnight
+
+    Returns:
+        List of (day, start_hour, end_hour) tuples for every free block, in time order
+    """
+    days = len(free_time) // 24
+    if days == 0:
+        return []
+    free_by_day = np.asarray(free_time, dtype=bool)[: days * 24].reshape(days, 24)
+
+    cuts = np.ones((days, 24), dtype=bool)
+    cuts[:, 1:23] = np.diff(free_by_day, axis=1)[:, :22]
+    cut_positions = np.flatnonzero(cuts)
+
+    block_starts = cut_positions[:-1]
+    block_ends = cut_positions[1:]
+    # Skip the gap from 11:00 PM to the following midnight, and any busy blocks
+    keep = (block_starts % 24 != 23) & free_by_day.ravel()[block_starts]
+    block_starts = block_starts[keep]
+    block_ends = block_ends[keep]
+
+    end_hours = block_ends % 24
+    end_hours[end_hours == 23] = 24
+    return list(
+        zip(
+            (block_starts // 24).tolist(),
+            (block_starts % 24).tolist(),
+            end_hours.tolist(),
+        )
+    )
+
+
+def rank_slots(
+    busy: np.ndarray,
+    allowed: np.ndarray,
+    duration: int,
+    min_attendees: int,
+    top_k: int,
+) -> list:
+    """
+    Finds the time slots the most people can make, for when nobody time works for everyone
+
+    Every window of duration hours is scored by how many people are free for all of
+    it, using prefix sums over the people x hours busy matrix. The best windows are
+    picked greedily without overlapping, and each one is stretched for as long as the
+    same people stay free.
+
+    Args:
+        busy: Boolean people x hours matrix, True where a person is working
+        allowed: Boolean array with one entry per hour, False for hours filtered out
+        duration: Int minimum length of a slot in hours
+        min_attendees: Int minimum number of people free for a slot
+        top_k: Int maximum number of slots to return
+
+    Returns:
+        List of (start_hour_index, end_hour_index, attendee_indexes) tuples, best first
+    """
+    n_people, periods = busy.shape
+    n_windows = periods - duration + 1
+    if duration < 1 or n_windows < 1:
+        return []
+
+    busy_prefix = np.zeros((n_people, periods + 1), dtype=np.int32)
+    busy_prefix[:, 1:] = np.cumsum(busy, axis=1)
+    busy_in_window = busy_prefix[:, duration:] - busy_prefix[:, :n_windows]
+    attendees = (busy_in_window == 0).sum(axis=0)
+
+    allowed_prefix = np.zeros(periods + 1, dtype=np.int32)
+    allowed_prefix[1:] = np.cumsum(allowed)
+    window_starts = np.arange(n_windows)
+    valid = (
+        (allowed_prefix[duration:] - allowed_prefix[:n_windows] == duration)
+        & (window_starts // 24 == (window_starts + duration - 1) // 24)
+        & (attendees >= max(min_attendees, 1))
+    )
+
+    candidates = window_starts[valid]
+    # Most attendees first, earliest first on ties
+    candidates = candidates[np.lexsort((candidates, -attendees[candidates]))]
+
+    taken = np.zeros(periods, dtype=bool)
+    slots = []
+    for start in candidates:
+        if len(slots) == top_k:
+            break
+        end = start + duration
+        if taken[start:end].any():
+            continue
+        attendee_indexes = np.flatnonzero(busy_in_window[:, start] == 0)
+        while (
+            end < periods
+            and end % 24 != 0
+            and allowed[end]
+            and not taken[end]
+            and not busy[attendee_indexes, end].any()
+        ):
+            end += 1
+        taken[start:end] = True
+        slots.append((int(start), int(end), attendee_indexes.tolist()))
+    return slots
+
+
+def merge_intervals(starts: np.ndarray, ends: np.ndarray) -> tuple:
+    """
+    Sweep-line merge of [start, end) intervals into sorted, non-overlapping intervals
+
+    Args:
+        starts: Int array of interval starts
+        ends: Int array of interval ends
+
+    Returns:
+        Tuple of merged starts and merged ends
+    """
+    if len(starts) == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    order = np.argsort(starts, kind="stable")
+    starts = np.asarray(starts, dtype=np.int64)[order]
+    ends = np.asarray(ends, dtype=np.int64)[order]
+
+    # An interval starts a new group when it begins after every earlier interval ended
+    running_ends = np.maximum.accumulate(ends)
+    new_group = np.ones(len(starts), dtype=bool)
+    new_group[1:] = starts[1:] > running_ends[:-1]
+    group_firsts = np.flatnonzero(new_group)
+    return starts[group_firsts], np.maximum.reduceat(ends, group_firsts)
+
+
+def busy_intervals(start_minutes: np.ndarray, end_minutes: np.ndarray, resolution: int) -> tuple:
+    """
+    Merged busy time of a group on a grid of resolution minute slots
+
+    Every shift covers the slots from its start through the slot containing its end
+    (both ends inclusive), so at a resolution of 60 minutes these are the hours
+    busy_matrix marks. Shifts that don't start on a slot boundary never line up with
+    the grid, so they cover nothing, like in busy_matrix.
+
+    Args:
+        start_minutes: Int array of shift starts, minutes since the epoch
+        end_minutes: Int array of shift ends, minutes since the epoch
+        resolution: Int minutes per slot, a divisor of 60
+
+    Returns:
+        Tuple of merged starts and merged ends, minutes since the epoch
+    """
+    start_minutes = np.asarray(start_minutes, dtype=np.int64)
+    end_minutes = np.asarray(end_minutes, dtype=np.int64)
+    on_grid = start_minutes % resolution == 0
+    return merge_intervals(
+        start_minutes[on_grid], (end_minutes[on_grid] // resolution + 1) * resolution
+    )
+
+
+def free_intervals(
+    busy_starts: np.ndarray,
+    busy_ends: np.ndarray,
+    window_start: int,
+    days: int,
+    start_minute: int,
+    end_minute: int,
+    resolution: int,
+) -> list:
+    """
+    Minute-level free time of a group, split at day boundaries
+
+    Time outside the daily start/end filter is treated as busy too, so the free time
+    is the gaps between the merged busy intervals. The cost grows with the number of
+    shifts and days, not with the window length divided by the resolution.
+
+    Like free_blocks, every day is cut at 11:00 PM: free time starting after it is
+    dropped, and a block reaching it is shown as ending at midnight.
+
+    Args:
+        busy_starts: Int array of busy interval starts, minutes since the epoch
+        busy_ends: Int array of busy interval ends, minutes since the epoch
+        window_start: Int minutes since the epoch of midnight on the first day
+        days: Int number of days in the window
+        start_minute: Int minute of the day free time can start at
+        end_minute: Int minute of the day free time has to end by
+        resolution: Int minutes free blocks are snapped to
+
+    Returns:
+        List of (day, start_minute, end_minute) tuples with minutes of the day, in time order
+    """
+    window_end = window_start + days * MINUTES_PER_DAY
+
+    # Every day, the time between end_minute and the next day's start_minute is off limits
+    day_starts = window_start + np.arange(-1, days) * MINUTES_PER_DAY
+    filtered_starts = day_starts + end_minute
+    filtered_ends = day_starts + MINUTES_PER_DAY + start_minute
+
+    merged_starts, merged_ends = merge_intervals(
+        np.concatenate([busy_starts, filtered_starts]),
+        np.concatenate([busy_ends, filtered_ends]),
+    )
+
+    # Gaps between busy intervals, clipped to the window
+    gap_starts = np.clip(np.concatenate([[window_start], merged_ends]), window_start, window_end)
+    gap_ends = np.clip(np.concatenate([merged_starts, [window_end]]), window_start, window_end)
+
+    # Snap inwards to the resolution
+    gap_starts = -(-(gap_starts - window_start) // resolution) * resolution + window_start
+    gap_ends = (gap_ends - window_start) // resolution * resolution + window_start
+    keep = gap_starts < gap_ends
+
+    blocks = []
+    for start, end in zip(gap_starts[keep].tolist(), gap_ends[keep].tolist()):
+        # Split free time running past midnight into one block per day
+        while start < end:
+            day = (start - window_start) // MINUTES_PER_DAY
+            day_end = window_start + (day + 1) * MINUTES_PER_DAY
+            block_end = min(end, day_end)
+            day_start = day_end - MINUTES_PER_DAY
+            if start - day_start < LAST_HOUR_START:
+                if block_end - day_start >= LAST_HOUR_START:
+                    block_end = day_end
+                blocks.append((day, start - day_start, block_end - day_start))
+            start = block_end
+    return blocks
@@ -0,0 +1,375 @@
+import argparse
+import datetime as dt
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+from defaults.constants import Constants
+from etl.metrics import timed
+from etl.serializers import get_serializer
+
+SCHEDULE_COLS = ["name", "team", "date", "staff_type", "start_time", "end_time", "grouping"]
+# Already parsed columns some cache formats store next to the raw ones
+PARSED_COLS = ["day", "start_minute", "end_minute"]
+PARTITION_PREFIX = "day="
+# Empty marker next to every partition, its modified time is when the date was last fetched
+FETCHED_SUFFIX = ".fetched"
+
+# Content digest of every partition read so far, path -> (mtime_ns, size, digest)
+_partition_digests = {}
+
+
+def changed_names(old: pd.DataFrame, new: pd.DataFrame) -> set:
+    """Names of everyone whose rows differ between two versions of a partition"""
+    old_rows = Counter(old[SCHEDULE_COLS].astype(str).itertuples(index=False, name=None))
+    new_rows = Counter(new[SCHEDULE_COLS].astype(str).itertuples(index=False, name=None))
+    return {row[0] for row in (old_rows - new_rows) + (new_rows - old_rows)}
+
+
+def partition_digest(entry: os.DirEntry) -> str:
+    """Hash of a partition's content, only re-read when the file changes"""
+    stat = entry.stat()
+    cached = _partition_digests.get(entry.path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    with open(entry.path, "rb") as infile:
+        digest = hashlib.sha1(infile.read()).hexdigest()
+    _partition_digests[entry.path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def missing_runs(days: list, max_days: int = None) -> list:
+    """
+    Groups sorted dates into (first_date, number_of_days) runs of consecutive dates
+
+    Args:
+        days: Sorted list of dates
+        max_days: Int longest run, longer runs are split into chunks, no limit if None
+
+    Returns:
+        List of (first_date, number_of_days) tuples
+    """
+    runs = []
+    for day in days:
+        if (
+            runs
+            and runs[-1][0] + dt.timedelta(runs[-1][1]) == day
+            and (max_days is None or runs[-1][1] < max_days)
+        ):
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((day, 1))
+    return runs
+
+
+class ScheduleCache:
+    """
+    Day-partitioned cache of raw Amion schedules
+
+    Each login code gets its own directory with one file per fetched date, so any
+    window can be served from the days already fetched, no matter which query
+    fetched them. Dates with no shifts are stored as empty partitions so they count as
+    fetched too.
+
+    Re-fetched partitions are diffed against the cached ones and only rewritten when
+    they changed, so a partition's modified time is when its content last changed.
+    The cache version hashes the partitions' content, memoized on that modified time,
+    so it and everything keyed on it survive refreshes where nothing changed without
+    re-reading any file. When a date was last fetched is kept apart, as the modified
+    time of an empty marker file next to its partition, and is checked against the
+    login code's TTL. A partition's access time is bumped on every read and is used to
+    evict the least recently used partitions once the cache is over its byte budget.
+    """
+
+    def __init__(self, cache_dir: str = None, cache_format: str = None):
+        constants = Constants()
+        self.cache_dir = cache_dir or constants.cache_dir
+        self.serializer = get_serializer(cache_format or constants.cache_format)
+        self.ttl_seconds = constants.cache_ttl_seconds
+        self.ttl_overrides = constants.cache_ttl_overrides
+        self.max_bytes = constants.cache_max_bytes
+
+    def login_dir(self, login_code: str) -> str:
+        return f"{self.cache_dir}/login={login_code}"
+
+    def partition_path(self, login_code: str, day: dt.date) -> str:
+        return (
+            f"{self.login_dir(login_code)}/"
+            f"{PARTITION_PREFIX}{day.strftime('%Y%m%d')}{self.serializer.suffix}"
+        )
+
+    def fetched_at(self, path: str) -> float:
+        """When a partition was last fetched, None if it isn't cached"""
+        try:
+            modified_at = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        try:
+            return os.stat(f"{path}{FETCHED_SUFFIX}").st_mtime
+        except FileNotFoundError:
+            # Partitions cached before the markers were added
+            return modified_at
+
+    def _mark_fetched(self, path: str) -> None:
+        marker = f"{path}{FETCHED_SUFFIX}"
+        with open(marker, "a"):
+            os.utime(marker)
+
+    def _remove(self, path: str) -> None:
+        """Removes a partition and its marker, the marker first so it is never left fresh"""
+        for file_path in [f"{path}{FETCHED_SUFFIX}", path]:
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+        _partition_digests.pop(path, None)
+
+    def ttl(self, login_code: str) -> int:
+        return self.ttl_overrides.get(login_code, self.ttl_seconds)
+
+    def login_codes(self) -> list:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return sorted(
+            entry.name[len("login=") :]
+            for entry in os.scandir(self.cache_dir)
+            if entry.is_dir() and entry.name.startswith("login=")
+        )
+
+    def _partitions(self, login_code: str) -> list:
+        """os.DirEntry of every partition of a login code"""
+        login_dir = self.login_dir(login_code)
+        if not os.path.isdir(login_dir):
+            return []
+        return [
+            entry
+            for entry in os.scandir(login_dir)
+            if entry.name.startswith(PARTITION_PREFIX)
+            and entry.name.endswith(self.serializer.suffix)
+        ]
+
+    def _partition_day(self, file_name: str) -> dt.date:
+        day = file_name[len(PARTITION_PREFIX) : -len(self.serializer.suffix)]
+        return dt.datetime.strptime(day, "%Y%m%d").date()
+
+    def cached_days(self, login_code: str) -> list:
+        """Sorted dates that have been fetched for a login code"""
+        return sorted(self._partition_day(entry.name) for entry in self._partitions(login_code))
+
+    def missing_days(self, login_code: str, days: list, max_age: float = None) -> list:
+        """
+        Dates out of days that still need to be fetched from Amion
+
+        Args:
+            login_code: amion login_code ex: "chla"
+            days: List of dates to check
+            max_age: Float seconds after which a partition is fetched again, the TTL if None
+
+        Returns:
+            List of dates that are not cached or expired
+        """
+        if max_age is None:
+            max_age = self.ttl(login_code)
+        fetched_after = time.time() - max_age
+        missing = []
+        for day in days:
+            fetched_at = self.fetched_at(self.partition_path(login_code, day))
+            if fetched_at is None or fetched_at < fetched_after:
+                missing.append(day)
+        return missing
+
+    def version(self, login_code: str) -> str:
+        """Changes whenever the content of a partition of the login code changes"""
+        digests = sorted(
+            (entry.name, partition_digest(entry)) for entry in self._partitions(login_code)
+        )
+        if len(digests) == 0:
+            return ""
+        return hashlib.sha1(str(digests).encode()).hexdigest()[:16]
+
+    @timed("cache_read")
+    def read(self, login_code: str, days: list = None) -> pd.DataFrame:
+        """
+        Reads the cached schedule rows of a login code
+
+        Args:
+            login_code: amion login_code ex: "chla"
+            days: List of dates to read, every cached date if None
+
+        Returns:
+            Pandas dataframe of raw schedule
+        """
+        if days is None:
+            days = self.cached_days(login_code)
+        paths = [self.partition_path(login_code, day) for day in days]
+        schedule = self.serializer.load_many(paths)
+        for path in paths:
+            try:
+                # Mark as recently used without changing the modified time, to the
+                # nanosecond, as content digests are memoized on it
+                st = os.stat(path)
+                os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+            except FileNotFoundError:
+                continue
+        if schedule is None:
+            return pd.DataFrame(columns=SCHEDULE_COLS)
+        if all(col in schedule.columns for col in PARSED_COLS):
+            return schedule[SCHEDULE_COLS + PARSED_COLS]
+        return schedule[SCHEDULE_COLS]
+
+    @timed("cache_write")
+    def write(self, login_code: str, days: list, schedule: pd.DataFrame) -> set:
+        """
+        Splits a fetched schedule into one partition per date
+
+        Every changed partition is written to a temporary file and renamed into place,
+        so readers never see a half-written partition. Partitions that didn't change
+        are only marked as fetched, which leaves their content digest memoized.
+
+        Args:
+            login_code: amion login_code ex: "chla"
+            days: List of every date the schedule was fetched for
+            schedule: Pandas dataframe of raw schedule
+
+        Returns:
+            Set of names of everyone whose rows changed, were added or were removed
+        """
+        os.makedirs(self.login_dir(login_code), exist_ok=True)
+        row_days = pd.to_datetime(schedule["date"], format="%m-%d-%y").dt.date
+        changed = set()
+        for day in days:
+            path = self.partition_path(login_code, day)
+            partition = schedule[row_days == day][SCHEDULE_COLS]
+            try:
+                day_changes = changed_names(self.serializer.load(path), partition)
+                if len(day_changes) == 0:
+                    self._mark_fetched(path)
+                    continue
+            except FileNotFoundError:
+                day_changes = set(partition["name"])
+            changed |= day_changes
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            self.serializer.dump(partition, tmp_path)
+            os.replace(tmp_path, path)
+            self._mark_fetched(path)
+        self.evict()
+        return changed
+
+    def evict(self, max_bytes: int = None) -> list:
+        """
+        Removes the least recently used partitions until the cache fits in max_bytes
+
+        Args:
+            max_bytes: Int size budget of the cache, the configured budget if None
+
+        Returns:
+            List of removed partition paths
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        partitions = []
+        for login_code in self.login_codes():
+            for entry in self._partitions(login_code):
+                stat = entry.stat()
+                partitions.append((stat.st_atime, stat.st_size, entry.path))
+
+        total_bytes = sum(size for _, size, _ in partitions)
+        removed = []
+        for _, size, path in sorted(partitions):
+            if total_bytes <= max_bytes:
+                break
+            self._remove(path)
+            total_bytes -= size
+            removed.append(path)
+        return removed
+
+    def prune(self, login_code: str = None, expired_only: bool = True) -> list:
+        """
+        Removes partitions from the cache
+
+        Args:
+            login_code: amion login_code to prune, every login code if None
+            expired_only: Bool, only remove partitions older than the TTL
+
+        Returns:
+            List of removed partition paths
+        """
+        login_codes = self.login_codes() if login_code is None else [login_code]
+        removed = []
+        for code in login_codes:
+            fetched_after = time.time() - self.ttl(code)
+            for entry in self._partitions(code):
+                fetched_at = self.fetched_at(entry.path)
+                if expired_only and fetched_at is not None and fetched_at >= fetched_after:
+                    continue
+                self._remove(entry.path)
+                removed.append(entry.path)
+        return removed
+
+    def summary(self) -> list:
+        """One dict per login code with its partition count, size and fetch times"""
+        rows = []
+        now = time.time()
+        for login_code in self.login_codes():
+            partitions = self._partitions(login_code)
+            stats = [entry.stat() for entry in partitions]
+            fetched = [self.fetched_at(entry.path) for entry in partitions]
+            days = self.cached_days(login_code)
+            rows.append(
+                {
+                    "login_code": login_code,
+                    "partitions": len(stats),
+                    "bytes": sum(stat.st_size for stat in stats),
+                    "first_day": days[0] if days else None,
+                    "last_day": days[-1] if days else None,
+                    "expired": sum(
+                        now - fetched_at > self.ttl(login_code)
+                        for fetched_at in fetched
+                        if fetched_at is not None
+                    ),
+                    "last_used": max((stat.st_atime for stat in stats), default=None),
+                }
+            )
+        return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the Amion schedule cache")
+    parser.add_argument("--cache-dir", default=None, help="defaults to _cache in the repo")
+    parser.add_argument("--format", default=None, help="cache format, defaults to Constants")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("ls", help="list cached login codes")
+    prune_parser = subparsers.add_parser("prune", help="remove cached partitions")
+    prune_parser.add_argument("--login", default=None, help="only prune this login code")
+    prune_parser.add_argument(
+        "--all", action="store_true", help="remove fresh partitions too, not only expired ones"
+    )
+    prune_parser.add_argument(
+        "--max-bytes", type=int, default=None, help="also evict down to this many bytes"
+    )
+    args = parser.parse_args()
+
+    cache = ScheduleCache(cache_dir=args.cache_dir, cache_format=args.format)
+    if args.command == "ls":
+        for row in cache.summary():
+            last_used = row["last_used"]
+            if last_used is not None:
+                last_used = dt.datetime.fromtimestamp(last_used).strftime("%Y-%m-%d %H:%M")
+            print(
+                f"{row['login_code']}: {row['partitions']} days "
+                f"({row['first_day']} to {row['last_day']}), {row['bytes']} bytes, "
+                f"{row['expired']} expired, last used {last_used}"
+            )
+    elif args.command == "prune":
+        removed = cache.prune(login_code=args.login, expired_only=not args.all)
+        if args.max_bytes is not None:
+            removed += cache.evict(max_bytes=args.max_bytes)
+        print(f"removed {len(removed)} partitions")
+
+
+if __name__ == "__main__":
+    main()
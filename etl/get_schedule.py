@@ -1,8 +1,31 @@
 import pandas as pd
+import numpy as np
 
 import datetime as dt
-from etl.utils import parse_dates, get_schedule
-from defaults.constants import Constants
+import hashlib
+import logging
+from typing import Tuple
+from etl.utils import parse_dates, get_schedule_store
+from etl.availability import (
+    busy_intervals,
+    busy_matrix,
+    free_blocks,
+    free_intervals,
+    hour_mask,
+    rank_slots,
+)
+from etl.store import ScheduleStore
+from etl.lru import LRUCache
+from etl.metrics import record_cache_lookup, timed
+from etl.shared_cache import get_shared_cache
+from defaults.constants import Constants, POSSIBLE_HOURS
+
+logger = logging.getLogger(__name__)
+
+# Merged busy intervals of recent searches, keyed on the search and its people's shifts
+_busy_intervals = LRUCache(maxsize=Constants().busy_intervals_cache_size)
+# Hour of the day -> label, like 13 -> "1:00 PM"
+DISPLAY_HOURS = {hour: display for display, hour in POSSIBLE_HOURS.items()}
 
 
 class Schedule:
@@ -14,8 +37,16 @@ class Schedule:
         names: list,
         start_time: str = "0",
         end_time: str = "24",
+        resolution: int = 60,
+        selection_id: str = None,
     ):
-        """Controller method to be called by model"""
+        """
+        Controller method to be called by model
+
+        Every resolution is computed with minute-level interval arithmetic on a grid of
+        resolution minute slots, which gives the old hourly results at 60 minutes.
+        Searches for a saved selection are cached by its ID instead of the full name list.
+        """
         # Handle no names selected
         if len(names) == 0:
             json_freetime = {"ERROR: NO NAMES SELECTED": ""}
@@ -24,77 +55,389 @@ class Schedule:
 
         # Find availability if names selected
         parsed_dates = parse_dates(start_date=start_date, end_date=end_date)
-        raw_schedule = get_schedule(
+        schedule_store = get_schedule_store(
             login_code=login_code,
             start_year=parsed_dates["start_year"],
             start_month=parsed_dates["start_month"],
             start_day=parsed_dates["start_day"],
             days=parsed_dates["days"],
         )
-        cleaned_schedule = self.clean_schedule(schedule=raw_schedule, names=names)
-        freetime, final_relevant_names = self.find_free_time(
-            schedule=cleaned_schedule,
-            start_year=parsed_dates["start_year"],
-            start_month=parsed_dates["start_month"],
-            start_day=parsed_dates["start_day"],
+
+        # Results are shared by every worker until the shifts of one of the people change
+        fingerprint = schedule_store.fingerprint(
+            names=names,
+            start_day=(parsed_dates["start_date"] - dt.datetime(1970, 1, 1)).days,
+            n_days=parsed_dates["days"],
+        )
+        if selection_id is not None:
+            # The selection ID already stands for the login code, names and dates
+            availability_key = (
+                f"availability:{selection_id}:{start_time}:{end_time}:{resolution}:{fingerprint}"
+            )
+        else:
+            availability_key = (
+                "availability:"
+                + hashlib.sha1(
+                    repr(
+                        (
+                            login_code,
+                            start_date,
+                            end_date,
+                            list(names),
+                            str(start_time),
+                            str(end_time),
+                            int(resolution),
+                            fingerprint,
+                        )
+                    ).encode()
+                ).hexdigest()
+            )
+        return get_shared_cache().get_or_compute(
+            availability_key,
+            lambda: self.compute_availability(
+                login_code=login_code,
+                schedule_store=schedule_store,
+                start_date=start_date,
+                end_date=end_date,
+                names=names,
+                start_time=start_time,
+                end_time=end_time,
+                resolution=resolution,
+            ),
+            ttl=Constants().shared_cache_ttl_seconds,
+            cache="availability",
+        )
+
+    def compute_availability(
+        self,
+        login_code: str,
+        schedule_store: ScheduleStore,
+        start_date: str,
+        end_date: str,
+        names: list,
+        start_time: str = "0",
+        end_time: str = "24",
+        resolution: int = 60,
+    ):
+        """Computes find_availability's result from the normalized schedule"""
+        parsed_dates = parse_dates(start_date=start_date, end_date=end_date)
+        resolution = int(resolution)
+
+        # Busy intervals don't depend on the start and end time filter, so they are reused
+        # when only the filter changes
+        busy_key = (
+            login_code,
+            start_date,
+            end_date,
+            tuple(names),
+            resolution,
+            schedule_store.fingerprint(
+                names=names,
+                start_day=(parsed_dates["start_date"] - dt.datetime(1970, 1, 1)).days,
+                n_days=parsed_dates["days"],
+            ),
+        )
+        busy = _busy_intervals.get(busy_key)
+        record_cache_lookup("busy_intervals", hits=int(busy is not None), misses=int(busy is None))
+        if busy is None:
+            cleaned_schedule = self.clean_schedule(
+                schedule=schedule_store,
+                names=names,
+                start_date=parsed_dates["start_date"],
+                days=parsed_dates["days"],
+            )
+            busy = self.find_busy_intervals(
+                schedule=cleaned_schedule, relevant_names=names, resolution=resolution
+            )
+            _busy_intervals.put(busy_key, busy)
+        busy_starts, busy_ends, final_relevant_names = busy
+
+        formatted_freetime = self.find_free_intervals(
+            busy_starts=busy_starts,
+            busy_ends=busy_ends,
+            start_date=parsed_dates["start_date"],
             days=parsed_dates["days"],
-            relevant_names=names,
             start_time=int(start_time),
             end_time=int(end_time),
+            resolution=resolution,
         )
-        formatted_freetime = self.format_free_time(freetime=freetime)
         json_freetime = self.freetime_to_json(formatted_freetime)
         return json_freetime, final_relevant_names
 
-    def clean_schedule(self, schedule: pd.DataFrame, names: list) -> pd.DataFrame:
+    def find_batch_availability(
+        self,
+        login_code: str,
+        start_date: str,
+        end_date: str,
+        groups: list,
+    ) -> list:
         """
-        Cleans raw schedule from amion api
-            - Handles double rows for multiple teams
-            - Handles 24 hour shifts
+        Finds the free time of many groups of people over the same dates at once
+
+        The schedule is loaded and cleaned once for everyone in any group, and the busy
+        counts of every group come out of one membership x busy matrix product.
 
         Args:
-            schedule: Dataframe of raw schedule from Amion API
+            login_code: amion login_code ex: "chla"
+            start_date: String of the first date, YYYY-MM-DD
+            end_date: String of the date after the last date, YYYY-MM-DD
+            groups: List of dicts with names, and optionally start_time and end_time
 
         Returns:
-            Schedule dataframe cleaned and formatted
+            List with (json_freetime, final_relevant_names) for every group
         """
+        parsed_dates = parse_dates(start_date=start_date, end_date=end_date)
+        all_names = list(dict.fromkeys(name for group in groups for name in group["names"]))
+        schedule_store = get_schedule_store(
+            login_code=login_code,
+            start_year=parsed_dates["start_year"],
+            start_month=parsed_dates["start_month"],
+            start_day=parsed_dates["start_day"],
+            days=parsed_dates["days"],
+        )
+        cleaned_schedule = self.clean_schedule(
+            schedule=schedule_store,
+            names=all_names,
+            start_date=parsed_dates["start_date"],
+            days=parsed_dates["days"],
+        )
+        _, busy, final_names = self.find_busy_hours(
+            schedule=cleaned_schedule,
+            start_year=parsed_dates["start_year"],
+            start_month=parsed_dates["start_month"],
+            start_day=parsed_dates["start_day"],
+            days=parsed_dates["days"],
+            relevant_names=all_names,
+        )
+
+        # groups x people membership, so every group's busy counts are one product
+        person_index = {name: i for i, name in enumerate(all_names)}
+        membership = np.zeros((len(groups), len(all_names)), dtype=np.int32)
+        for i, group in enumerate(groups):
+            membership[i, [person_index[name] for name in group["names"]]] = 1
+        working_ct = membership @ busy.astype(np.int32)
+
+        hours = np.arange(busy.shape[1]) % 24
+        start_times = np.array([int(group.get("start_time", 0)) for group in groups])
+        end_times = np.array([int(group.get("end_time", 24)) for group in groups])
+        free_time = (
+            (working_ct == 0)
+            & (hours[None, :] >= start_times[:, None])
+            & (hours[None, :] <= end_times[:, None])
+        )
 
-        schedule_no_ids = schedule[
-            (schedule["grouping"].isin(["On Call", "Clinic"]))
-            & (schedule["staff_type"].isin(Constants().allowed_staff_types))
-        ][["name", "team", "date", "start_time", "end_time"]].copy()
-        if len(names) > 0:
-            schedule_no_ids = schedule_no_ids[schedule_no_ids["name"].isin(names)]
-        schedule_no_ids["date"] = pd.to_datetime(schedule_no_ids["date"], format="%m-%d-%y")
-
-        # Handling weirdness in the data:
-        # If you are team 4/5, it can show as 2 lines
-        schedule_no_ids["team"] = schedule_no_ids.groupby(
-            ["name", "date", "start_time", "end_time"]
-        )["team"].transform(lambda x: ", ".join(x))
-        schedule_no_ids = schedule_no_ids.drop_duplicates()
-
-        for time_col in ["start_time", "end_time"]:
-            schedule_no_ids.loc[schedule_no_ids[time_col].astype(str) == "0", time_col] = "000"
-            schedule_no_ids[time_col] = schedule_no_ids[time_col].astype(str)
-            schedule_no_ids[time_col] = (
-                schedule_no_ids[time_col].str[:-2] + ":" + schedule_no_ids[time_col].str[-2:]
+        results = []
+        for i, group in enumerate(groups):
+            if len(group["names"]) == 0:
+                results.append(({"ERROR: NO NAMES SELECTED": ""}, []))
+                continue
+            formatted_freetime = self.format_free_hours(
+                free_time=free_time[i], start_date=parsed_dates["start_date"].date()
+            )
+            results.append(
+                (
+                    self.freetime_to_json(formatted_freetime),
+                    [final_names[person_index[name]] for name in group["names"]],
+                )
             )
-            schedule_no_ids[time_col] = (
-                schedule_no_ids["date"].dt.date.astype(str) + " " + schedule_no_ids[time_col]
+        return results
+
+    def find_best_slots(
+        self,
+        login_code: str,
+        start_date: str,
+        end_date: str,
+        names: list,
+        duration: int = 1,
+        min_attendees: int = 1,
+        top_k: int = 10,
+        start_time: str = "0",
+        end_time: str = "24",
+    ) -> list:
+        """
+        Ranks the time slots by how many of the selected people are free
+
+        Args:
+            login_code: amion login_code ex: "chla"
+            start_date: String of the first date, YYYY-MM-DD
+            end_date: String of the date after the last date, YYYY-MM-DD
+            names: List of selected names
+            duration: Int minimum length of a slot in hours
+            min_attendees: Int minimum number of people free for a slot
+            top_k: Int maximum number of slots to return
+            start_time: String hour of the day slots can start at
+            end_time: String hour of the day slots have to end by
+
+        Returns:
+            List of slot dicts, most attendees first
+        """
+        if len(names) == 0:
+            return []
+        parsed_dates = parse_dates(start_date=start_date, end_date=end_date)
+        schedule_store = get_schedule_store(
+            login_code=login_code,
+            start_year=parsed_dates["start_year"],
+            start_month=parsed_dates["start_month"],
+            start_day=parsed_dates["start_day"],
+            days=parsed_dates["days"],
+        )
+        cleaned_schedule = self.clean_schedule(
+            schedule=schedule_store,
+            names=names,
+            start_date=parsed_dates["start_date"],
+            days=parsed_dates["days"],
+        )
+        _, busy, final_relevant_names = self.find_busy_hours(
+            schedule=cleaned_schedule,
+            start_year=parsed_dates["start_year"],
+            start_month=parsed_dates["start_month"],
+            start_day=parsed_dates["start_day"],
+            days=parsed_dates["days"],
+            relevant_names=names,
+        )
+
+        # A slot has to end by end_time, so its last hour is the one before
+        hours = np.arange(busy.shape[1]) % 24
+        allowed = hour_mask(hours, int(start_time), int(end_time) - 1)
+        first_date = parsed_dates["start_date"].date()
+
+        slots = []
+        for start, end, attendee_indexes in rank_slots(
+            busy=busy,
+            allowed=allowed,
+            duration=int(duration),
+            min_attendees=int(min_attendees),
+            top_k=int(top_k),
+        ):
+            start_hour = start % 24
+            end_hour = end - start + start_hour
+            attending = [final_relevant_names[i] for i in attendee_indexes]
+            slots.append(
+                {
+                    "date": (first_date + dt.timedelta(days=start // 24)).strftime("%b %-d (%a)"),
+                    "start_time": start_hour,
+                    "end_time": end_hour,
+                    "display_time_range": f"{DISPLAY_HOURS[start_hour]} to {DISPLAY_HOURS[end_hour]}",
+                    "display_hour_range": f"({str(end_hour - start_hour)} hours)",
+                    "attendee_count": len(attending),
+                    "attending": attending,
+                    "missing": [name for name in final_relevant_names if name not in attending],
+                }
             )
-            schedule_no_ids[time_col] = pd.to_datetime(
-                schedule_no_ids[time_col], format="%Y-%m-%d %H:%M"
+        return slots
+
+    def schedule_version(
+        self, login_code: str, start_date: str, end_date: str, names: list = None
+    ) -> str:
+        """
+        Version of the cached schedule covering the dates
+
+        With names, only changes when the shifts of those people between the dates change.
+        Otherwise it changes whenever any cached date changes.
+        """
+        parsed_dates = parse_dates(start_date=start_date, end_date=end_date)
+        schedule_store = get_schedule_store(
+            login_code=login_code,
+            start_year=parsed_dates["start_year"],
+            start_month=parsed_dates["start_month"],
+            start_day=parsed_dates["start_day"],
+            days=parsed_dates["days"],
+        )
+        if names is not None:
+            return schedule_store.fingerprint(
+                names=names,
+                start_day=(parsed_dates["start_date"] - dt.datetime(1970, 1, 1)).days,
+                n_days=parsed_dates["days"],
             )
+        return schedule_store.version
+
+    @timed("clean_schedule")
+    def clean_schedule(
+        self,
+        schedule: ScheduleStore,
+        names: list,
+        start_date: dt.datetime = None,
+        days: int = None,
+        overlapping: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Selects the cleaned shifts of the given people from the normalized schedule
+            - Double rows for multiple teams are already merged by the store
+            - 24 hour and overnight shifts are already handled by the store
+
+        Args:
+            schedule: ScheduleStore of the schedule from Amion API
+            names: List of names to select
+            start_date: Datetime of the first date to select, every date if None
+            days: Int number of dates to select
+            overlapping: Bool, also select shifts from earlier dates running into start_date
+
+        Returns:
+            Schedule dataframe cleaned and formatted
+        """
+        start_day = None
+        if start_date is not None:
+            start_day = (start_date - dt.datetime(1970, 1, 1)).days
+        return schedule.shifts(
+            names=names, start_day=start_day, n_days=days, overlapping=overlapping
+        )
 
-        # If start_time and end_time are the same, it's because its a 24 hr shift
-        # If start time is later in the day then end time, then it's a night shift
-        schedule_no_ids.loc[
-            schedule_no_ids["start_time"] >= schedule_no_ids["end_time"], "end_time"
-        ] = schedule_no_ids["end_time"] + dt.timedelta(days=1)
-        schedule_no_ids = schedule_no_ids[["name", "team", "start_time", "end_time"]]
-        return schedule_no_ids
+    @timed("find_busy_hours")
+    def find_busy_hours(
+        self,
+        schedule: pd.DataFrame,
+        start_year: int,
+        start_month: int,
+        start_day: int,
+        days: int,
+        relevant_names: list,
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray, list]:
+        """
+        Builds a people x hours matrix of who is working
 
+        Args:
+            schedule: Dataframe of cleaned shifts
+            start_year: Int of year to start query
+            start_month: Int of month to start query
+            start_day: Int of day to start query
+            days: Int of number of days from from start to complete search
+            relevant_names: List of selected names, one matrix row each
+
+        Returns:
+            Hourly DatetimeIndex of the scope, boolean busy matrix and the selected
+            names with a * for people without shifts
+        """
+
+        # Get every hour between start and end date
+        scope = pd.date_range(
+            start=f"{str(start_year)}-{str(start_month)}-{str(start_day)}",
+            periods=int(days) * 24,
+            freq="1H",
+        )
+
+        # People without any shifts in the schedule are marked with a *
+        scheduled_names = set(schedule["name"]) if schedule.shape[0] > 0 else set()
+        final_relevant_names = [
+            name if name in scheduled_names else f"{name}*" for name in relevant_names
+        ]
+
+        # One row per selected person, one column per hour in scope
+        person_index = {name: i for i, name in enumerate(relevant_names)}
+        shifts = schedule[schedule["name"].isin(person_index.keys())]
+        scope_start = scope[0] if len(scope) > 0 else pd.Timestamp(0)
+        busy = busy_matrix(
+            person_codes=shifts["name"].map(person_index).to_numpy(),
+            start_minutes=(pd.to_datetime(shifts["start_time"]) - scope_start)
+            // pd.Timedelta(minutes=1),
+            end_minutes=(pd.to_datetime(shifts["end_time"]) - scope_start)
+            // pd.Timedelta(minutes=1),
+            n_people=len(relevant_names),
+            periods=len(scope),
+        )
+
+        return scope, busy, final_relevant_names
+
+    @timed("find_free_time")
     def find_free_time(
         self,
         schedule: pd.DataFrame,
@@ -107,176 +450,154 @@ class Schedule:
         end_time: int,
     ) -> pd.DataFrame:
         """Identifies which hours people are working and not working"""
-
-        # Get every hour between start and end date
-        scope = pd.DataFrame(
-            pd.date_range(
-                start=f"{str(start_year)}-{str(start_month)}-{str(start_day)}",
-                periods=int(days) * 24,
-                freq="1H",
-            ),
-            columns=["date"],
+        scope, busy, final_relevant_names = self.find_busy_hours(
+            schedule=schedule,
+            start_year=start_year,
+            start_month=start_month,
+            start_day=start_day,
+            days=days,
+            relevant_names=relevant_names,
         )
+        hours = scope.hour.to_numpy().astype(int)
 
-        # If schedule is empty for selected dates then all times are free
-        if schedule.shape[0] == 0:
-            working_hours = pd.DataFrame({"working_hour": []})
-        else:
-            working_hours = schedule.copy()
-            working_hours["start_time"] = pd.to_datetime(working_hours["start_time"])
-            working_hours["end_time"] = pd.to_datetime(working_hours["end_time"])
-            working_hours["hour"] = working_hours.apply(
-                lambda row: pd.date_range(row["start_time"], row["end_time"], freq="H"), axis=1
-            )
+        # Free when nobody is working, within the selected start and end time
+        free_time = ~busy.any(axis=0) & hour_mask(hours, start_time, end_time)
 
-            working_hours = (
-                working_hours.explode("hour")
-                .reset_index()
-                .drop(columns=["start_time", "end_time"])
-                .rename(columns={"hour": "working_hour"})
-                .set_index("working_hour")
-                .reset_index()[["name", "working_hour"]]
-                .assign(working=1)
-                .pivot_table(index="working_hour", columns="name", values="working")
-                .reset_index()
-            )
-        final_relevant_names = []
-        for name in relevant_names:
-            if name not in working_hours.columns:
-                updated_name = f"{name}*"
-                working_hours[updated_name] = 0
-                final_relevant_names.append(updated_name)
-            else:
-                final_relevant_names.append(name)
-
-        work_nonwork = scope.merge(
-            working_hours,
-            how="left",
-            left_on="date",
-            right_on="working_hour",
-        ).fillna(0)
-
-        for name in final_relevant_names:
-            if "working_ct" not in work_nonwork.columns:
-                work_nonwork["working_ct"] = work_nonwork[name]
-            else:
-                work_nonwork["working_ct"] += work_nonwork[name]
-
-        # Cleanup
-        work_nonwork["timestamp"] = work_nonwork["date"]
-        work_nonwork["hour"] = (
-            work_nonwork["date"].dt.strftime("%H:%M").str.split(":").str[0].astype(int)
+        work_nonwork = pd.DataFrame(
+            {"timestamp": scope, "date": scope.date, "hour": hours.astype("int64")}
         )
-        work_nonwork["date"] = work_nonwork["date"].dt.date
+        for i, final_name in enumerate(final_relevant_names):
+            work_nonwork[final_name] = busy[i].astype(float)
+        work_nonwork["free_time"] = free_time
 
-        # Apply filter selected on start and end time to look for:
-        work_nonwork.loc[
-            (
-                ((work_nonwork["hour"] < start_time) | (work_nonwork["hour"] > end_time))
-                & (work_nonwork["working_ct"] == 0)
-            ),
-            "working_ct",
-        ] = 1
+        return work_nonwork, final_relevant_names
 
-        # Tag rows
-        free_condition = work_nonwork["working_ct"] == 0
-        work_nonwork["free_time"] = False
-        work_nonwork.loc[free_condition, "free_time"] = True
+    @timed("find_busy_intervals")
+    def find_busy_intervals(
+        self, schedule: pd.DataFrame, relevant_names: list, resolution: int
+    ) -> Tuple[np.ndarray, np.ndarray, list]:
+        """
+        Merges the shifts of the selected people into busy intervals
+
+        Args:
+            schedule: Dataframe of cleaned shifts
+            relevant_names: List of selected names
+            resolution: Int minutes per slot of the grid shifts are placed on, ex: 15
 
-        return (
-            work_nonwork[["timestamp", "date", "hour"] + final_relevant_names + ["free_time"]],
-            final_relevant_names,
+        Returns:
+            Busy interval starts and ends in minutes since the epoch, and the selected
+            names with a * for people without shifts
+        """
+        scheduled_names = set(schedule["name"]) if schedule.shape[0] > 0 else set()
+        final_relevant_names = [
+            name if name in scheduled_names else f"{name}*" for name in relevant_names
+        ]
+
+        shifts = schedule[schedule["name"].isin(relevant_names)]
+        busy_starts, busy_ends = busy_intervals(
+            start_minutes=pd.to_datetime(shifts["start_time"])
+            .to_numpy()
+            .astype("datetime64[m]")
+            .astype(np.int64),
+            end_minutes=pd.to_datetime(shifts["end_time"])
+            .to_numpy()
+            .astype("datetime64[m]")
+            .astype(np.int64),
+            resolution=resolution,
         )
+        return busy_starts, busy_ends, final_relevant_names
 
-    def format_free_time(self, freetime: pd.DataFrame):
-        """Formats dataframe for display on site"""
-        # TODO: add # of hours next to free time blocks
+    @timed("find_free_intervals")
+    def find_free_intervals(
+        self,
+        busy_starts: np.ndarray,
+        busy_ends: np.ndarray,
+        start_date: dt.datetime,
+        days: int,
+        start_time: int,
+        end_time: int,
+        resolution: int,
+    ) -> list:
+        """
+        Finds free time at minute-level resolution from the busy intervals
 
-        freetime.loc[freetime["hour"] == 23, "timestamp"] = freetime["timestamp"] + pd.Timedelta(
-            minutes=59
-        )
-        freetime["timestamp"] = freetime["timestamp"].dt.strftime("%-I:%M %p")
-        freetime = freetime.reset_index()
-        freetime_fwd = freetime.copy()
-        freetime_fwd["index"] = freetime_fwd["index"] + 1
-
-        ft = freetime.merge(
-            freetime_fwd[["index", "date", "free_time"]],
-            on="index",
-            how="left",
-            suffixes=["", "_1hr_fwd"],
+        Args:
+            busy_starts: Int array of busy interval starts, minutes since the epoch
+            busy_ends: Int array of busy interval ends, minutes since the epoch
+            start_date: Datetime of the first date
+            days: Int number of days
+            start_time: Int first hour of the day that can be free
+            end_time: Int last hour of the day that can be free, 24 for the whole day
+            resolution: Int minutes free blocks are snapped to, ex: 15
+
+        Returns:
+            Display blocks like format_free_time's, with fractional hours
+        """
+        blocks = free_intervals(
+            busy_starts=busy_starts,
+            busy_ends=busy_ends,
+            window_start=(start_date - dt.datetime(1970, 1, 1)).days * 24 * 60,
+            days=int(days),
+            start_minute=start_time * 60,
+            # The whole end_time hour can be free, like in hour_mask
+            end_minute=min(end_time + 1, 24) * 60,
+            resolution=resolution,
         )
 
-        ft = ft.loc[
-            (ft["date_1hr_fwd"].isnull())
-            | ((ft["date"] == ft["date_1hr_fwd"]) & (ft["free_time"] != ft["free_time_1hr_fwd"]))
-            | ((ft["hour"] == 23) & (ft["free_time"] == ft["free_time_1hr_fwd"]))
-            | (ft["hour"] == 0)
-        ][["timestamp", "date", "hour", "free_time"]]
-
-        ct = 0
-        list_of_display_rows = []
-        for row in ft.to_dict("records"):
-            if ct == 0 or row["hour"] == 0:
-                time_start = str(row["timestamp"])
-                free_at_start = row["free_time"]
-                hour_start = row["hour"]
-                time_end = ""
-                ct += 1
-            elif time_end == "":
-                time_end = str(row["timestamp"])
-                free_at_end = row["free_time"]
-                hour_end = row["hour"]
-
-                if free_at_start:
-                    status = "FREE"
-                else:
-                    status = "BUSY"
-
-                list_of_display_rows.append(
-                    pd.DataFrame(
-                        {
-                            "status": [status],
-                            "date": [str(row["date"])],
-                            "start_time": [int(round(hour_start))],
-                            "end_time": [int(round(hour_end))],
-                            "time_period": [f"{time_start} to {time_end}"],
-                        }
-                    )
-                )
+        def to_hours(minute):
+            return minute // 60 if minute % 60 == 0 else minute / 60
 
-                free_at_start = free_at_end
-                time_start = time_end
-                hour_start = hour_end
-                time_end = ""
-                ct += 1
+        def to_display(minute):
+            if minute == 24 * 60:
+                return "11:59 PM"
+            return (dt.datetime(1970, 1, 1) + dt.timedelta(minutes=minute)).strftime("%-I:%M %p")
 
-        display_df = pd.concat(list_of_display_rows)
+        formatted_freetime = [
+            {
+                "date": start_date.date() + dt.timedelta(days=day),
+                "start_time": to_hours(start_minute),
+                "end_time": to_hours(end_minute),
+                "time_period": f"{to_display(start_minute)} to {to_display(end_minute)}",
+            }
+            for day, start_minute, end_minute in blocks
+        ]
+        return formatted_freetime
+
+    @timed("format_free_time")
+    def format_free_time(self, freetime: pd.DataFrame) -> list:
+        """Formats free hours into display blocks for the site"""
+        if freetime.shape[0] == 0:
+            return []
+        return self.format_free_hours(
+            free_time=freetime["free_time"].to_numpy(), start_date=freetime["date"].iloc[0]
+        )
 
-        return display_df[display_df["status"] == "FREE"].drop(columns="status")
+    @timed("format_free_hours")
+    def format_free_hours(self, free_time: np.ndarray, start_date: dt.date) -> list:
+        """Formats hourly free/busy flags starting at midnight of start_date into display blocks"""
+        # TODO: add # of hours next to free time blocks
+        return [
+            {
+                "date": start_date + dt.timedelta(days=day),
+                "start_time": start_hour,
+                "end_time": end_hour,
+                "time_period": f"{DISPLAY_HOURS[start_hour]} to {DISPLAY_HOURS[end_hour]}",
+            }
+            for day, start_hour, end_hour in free_blocks(free_time)
+        ]
 
-    def freetime_to_json(self, freetime: pd.DataFrame) -> dict:
+    @timed("freetime_to_json")
+    def freetime_to_json(self, freetime: list) -> dict:
         availabilities = {}
-        prev_date = ""
-        freetime = freetime.sort_values(by="date")
-        freetime["date"] = pd.to_datetime(freetime["date"]).dt.strftime("%b %-d (%a)")
-        for row in freetime.iterrows():
-            r = row[1]
-            if r["end_time"] == 23:
-                r["end_time"] = 24
-            hours = int(r["end_time"] - r["start_time"])
+        for block in freetime:
             free_time_detail = {
-                "start_time": r["start_time"],
-                "end_time": r["end_time"],
-                "display_time_range": f"{r['time_period']}",
-                "display_hour_range": f"({str(hours)} hours)",
+                "start_time": block["start_time"],
+                "end_time": block["end_time"],
+                "display_time_range": block["time_period"],
+                "display_hour_range": f"({block['end_time'] - block['start_time']:g} hours)",
             }
-            if r["date"] != prev_date:
-                availabilities[r["date"]] = [free_time_detail]
-                prev_date = r["date"]
-            else:
-                availabilities[r["date"]].append(free_time_detail)
-                prev_date = r["date"]
-        print("\nAvailabilities:")
-        print(availabilities)
+            availabilities.setdefault(block["date"].strftime("%b %-d (%a)"), []).append(
+                free_time_detail
+            )
+        logger.debug("Availabilities: %s", availabilities)
         return availabilities
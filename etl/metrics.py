@@ -0,0 +1,145 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from cache hits up to slow Amion requests
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Every metric in the order it was created, rendered by the /metrics route
+_registry = []
+
+
+def _format_labels(labels: dict) -> str:
+    if len(labels) == 0:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Prometheus-style counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.label_names), 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [
+                (self.name, dict(zip(self.label_names, key)), value)
+                for key, value in sorted(self._values.items())
+            ]
+
+
+class Histogram:
+    """Prometheus-style histogram of durations in seconds, with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # Label values -> [count per bucket, sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels[name] for name in self.label_names)
+        with self._lock:
+            bucket_counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    bucket_counts[i] += 1
+            self._values[key] = (bucket_counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time of the with block, also usable as a decorator"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> list:
+        samples = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._values.items()):
+                labels = dict(zip(self.label_names, key))
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    samples.append(
+                        (f"{self.name}_bucket", dict(labels, le=f"{bound:g}"), bucket_count)
+                    )
+                samples.append((f"{self.name}_bucket", dict(labels, le="+Inf"), count))
+                samples.append((f"{self.name}_sum", labels, total))
+                samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+stage_seconds = Histogram(
+    "residents_stage_seconds", "Time spent in each stage of a request", ("stage",)
+)
+request_seconds = Histogram(
+    "residents_request_seconds", "Time spent answering HTTP requests", ("endpoint", "status")
+)
+cache_hits = Counter("residents_cache_hits_total", "Lookups served from a cache", ("cache",))
+cache_misses = Counter(
+    "residents_cache_misses_total", "Lookups that had to be computed or fetched", ("cache",)
+)
+amion_errors = Counter(
+    "residents_amion_errors_total", "Amion requests that failed after retries", ()
+)
+
+
+def timed(stage: str):
+    """
+    Times a stage into residents_stage_seconds
+
+    Works both as a context manager, `with timed("cache_read"):`, and as a
+    decorator, `@timed("clean_schedule")`.
+    """
+    return stage_seconds.time(stage=stage)
+
+
+def record_cache_lookup(cache: str, hits: int = 0, misses: int = 0) -> None:
+    if hits:
+        cache_hits.inc(hits, cache=cache)
+    if misses:
+        cache_misses.inc(misses, cache=cache)
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,95 @@
+import datetime as dt
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from defaults.constants import Constants
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchWorker:
+    """
+    Background thread keeping the schedules of recently used access codes cached
+
+    Routes register the access codes they serve. Every interval, the worker
+    re-fetches the upcoming days of each active access code before their cache TTL
+    runs out, so users don't wait on Amion. Refreshes run on a small thread pool,
+    each after a random delay so they don't all hit Amion at once.
+    """
+
+    def __init__(self):
+        constants = Constants()
+        self.interval_seconds = constants.prefetch_interval_seconds
+        self.active_seconds = constants.prefetch_active_seconds
+        self.days = constants.prefetch_days
+        self.refresh_margin_seconds = constants.prefetch_refresh_margin_seconds
+        self.max_workers = constants.prefetch_max_workers
+        self.jitter_seconds = constants.prefetch_jitter_seconds
+        self.name_directory_days = constants.name_directory_days
+
+        self._last_used = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, login_code: str) -> None:
+        """Marks an access code as recently used"""
+        with self._lock:
+            self._last_used[login_code] = time.time()
+
+    def active_login_codes(self) -> list:
+        """Access codes used within the active period, forgetting the others"""
+        used_after = time.time() - self.active_seconds
+        with self._lock:
+            for login_code in [
+                code for code, last_used in self._last_used.items() if last_used < used_after
+            ]:
+                del self._last_used[login_code]
+            return list(self._last_used)
+
+    def refresh(self, login_code: str) -> None:
+        """
+        Re-fetches the upcoming days of an access code that are about to expire and
+        builds the name directory of the filter page ahead of time
+        """
+        # Imported here so starting the worker doesn't load pandas
+        from etl.cache import ScheduleCache
+        from etl.utils import get_schedule_store
+
+        time.sleep(random.uniform(0, self.jitter_seconds))
+        today = dt.date.today()
+        max_age = max(ScheduleCache().ttl(login_code) - self.refresh_margin_seconds, 0)
+        try:
+            schedule_store = get_schedule_store(
+                login_code=login_code,
+                start_year=today.year,
+                start_month=today.month,
+                start_day=today.day,
+                days=self.days,
+                max_age=max_age,
+            )
+            schedule_store.name_directory(
+                start_day=(today - dt.date(1970, 1, 1)).days, n_days=self.name_directory_days
+            )
+        except Exception as e:
+            logger.warning("prefetch of %s failed: %s", login_code, e)
+
+    def run_once(self) -> None:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(self.refresh, self.active_login_codes()))
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.run_once()
+
+    def start(self) -> "PrefetchWorker":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,86 @@
+import base64
+import hashlib
+
+from defaults.constants import Constants
+from etl.shared_cache import SharedCache, get_shared_cache
+
+
+class SelectionStore:
+    """
+    Server-side name selections, referenced by short opaque IDs
+
+    The filter page saves the selected names and dates here and passes only the ID
+    along, so requests stay the same size however many people are selected. Names are
+    interned into per-login integer IDs and a selection stores its name IDs, so saving
+    the same selection again gives the same ID and the results computed for it can be
+    cached by ID. Selections live in the shared cache, so every worker can resolve
+    them, and expire after selection_ttl_seconds.
+    """
+
+    def __init__(self, shared_cache: SharedCache = None):
+        self.shared_cache = shared_cache or get_shared_cache()
+        self.ttl_seconds = Constants().selection_ttl_seconds
+
+    def _intern(self, login_code: str, names: list) -> list:
+        """Integer IDs of names in the login code's name table, adding the new ones"""
+        key = f"names:{login_code}"
+        with self.shared_cache.lock(key):
+            table = self.shared_cache.get(key) or []
+            index = {name: i for i, name in enumerate(table)}
+            for name in names:
+                if name not in index:
+                    index[name] = len(table)
+                    table.append(name)
+            # Re-saved every time so the table outlives every selection using it
+            self.shared_cache.set(key, table, ttl=self.ttl_seconds)
+        return [index[name] for name in names]
+
+    def save(self, login_code: str, names: list, start_date: str, end_date: str) -> str:
+        """
+        Saves a selection and returns its ID
+
+        Args:
+            login_code: amion login_code ex: "chla"
+            names: List of selected names, in display order
+            start_date: String start date "YYYY-MM-DD"
+            end_date: String end date "YYYY-MM-DD"
+
+        Returns:
+            String URL-safe ID of 11 characters
+        """
+        name_ids = self._intern(login_code, list(names))
+        digest = hashlib.sha1(repr((login_code, name_ids, start_date, end_date)).encode())
+        selection_id = base64.urlsafe_b64encode(digest.digest()[:8]).decode().rstrip("=")
+        self.shared_cache.set(
+            f"selection:{selection_id}",
+            {
+                "login_code": login_code,
+                "name_ids": name_ids,
+                "start_date": start_date,
+                "end_date": end_date,
+            },
+            ttl=self.ttl_seconds,
+        )
+        return selection_id
+
+    def load(self, selection_id: str) -> dict:
+        """
+        Looks up a selection by ID
+
+        Returns:
+            Dict with login_code, names, start_date and end_date, None if the selection
+            doesn't exist or expired
+        """
+        selection = self.shared_cache.get(f"selection:{selection_id}")
+        if selection is None:
+            return None
+        table = self.shared_cache.get(f"names:{selection['login_code']}") or []
+        if any(name_id >= len(table) for name_id in selection["name_ids"]):
+            return None
+        return {
+            "selection_id": selection_id,
+            "login_code": selection["login_code"],
+            "names": [table[name_id] for name_id in selection["name_ids"]],
+            "start_date": selection["start_date"],
+            "end_date": selection["end_date"],
+        }
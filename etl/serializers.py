@@ -0,0 +1,173 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def military_to_minutes(times: pd.Series) -> np.ndarray:
+    """Converts Amion times like "0730", "0" or 730 into minutes after midnight"""
+    military = pd.to_numeric(times, errors="coerce").to_numpy(dtype=float)
+    return np.floor_divide(military, 100) * 60 + np.mod(military, 100)
+
+
+class Serializer:
+    """Reads and writes cache partitions in one file format"""
+
+    suffix = ""
+
+    def dump(self, schedule: pd.DataFrame, path: str) -> None:
+        raise NotImplementedError
+
+    def load(self, path: str) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def load_many(self, paths: list) -> pd.DataFrame:
+        """
+        Loads and concatenates partitions, skipping the ones that don't exist anymore
+
+        Returns:
+            Pandas dataframe of every row, None if no partition exists
+        """
+        partitions = []
+        for path in paths:
+            try:
+                partitions.append(self.load(path))
+            except FileNotFoundError:
+                continue
+        if len(partitions) == 0:
+            return None
+        return pd.concat(partitions, ignore_index=True)
+
+
+class CsvSerializer(Serializer):
+    """Plain text partitions, every load re-parses the strings"""
+
+    suffix = ".csv"
+
+    def dump(self, schedule: pd.DataFrame, path: str) -> None:
+        schedule.to_csv(path, index=False)
+
+    def load(self, path: str) -> pd.DataFrame:
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+
+
+class NpySerializer(Serializer):
+    """
+    Partitions stored as NumPy arrays of integer codes into a small string table
+
+    Every string column is interned into int32 codes into one table of the partition's
+    distinct strings, and the date and shift times are also stored already parsed, as
+    int32 days since the epoch and float32 minutes after midnight (NaN if a time isn't
+    a number). A load reads two flat arrays and takes the strings from the table, so a
+    cache hit doesn't parse anything or build a string per field.
+    """
+
+    suffix = ".npy"
+    string_columns = ["name", "team", "date", "staff_type", "start_time", "end_time", "grouping"]
+
+    def dump(self, schedule: pd.DataFrame, path: str) -> None:
+        columns = [col for col in self.string_columns if col in schedule.columns]
+        codes, strings = pd.factorize(
+            pd.concat([schedule[col].astype(str) for col in columns], ignore_index=True)
+        )
+        records = np.empty(
+            len(schedule),
+            dtype=[(col, "<i4") for col in columns]
+            + [("day", "<i4"), ("start_minute", "<f4"), ("end_minute", "<f4")],
+        )
+        for i, col in enumerate(columns):
+            records[col] = codes[i * len(schedule) : (i + 1) * len(schedule)]
+        days = pd.to_datetime(schedule["date"], format="%m-%d-%y") - pd.Timestamp(0)
+        records["day"] = days // pd.Timedelta(days=1)
+        records["start_minute"] = military_to_minutes(schedule["start_time"])
+        records["end_minute"] = military_to_minutes(schedule["end_time"])
+        # Write through a file object so np.save doesn't add a second .npy suffix
+        with open(path, "wb") as outfile:
+            np.save(outfile, records)
+            # The string table as one NUL separated UTF-8 buffer, Amion fields never hold NUL
+            np.save(outfile, np.frombuffer("\0".join(strings).encode(), dtype=np.uint8))
+
+    def _read(self, path: str) -> tuple:
+        """The records and string table of a partition, no table if it predates interning"""
+        with open(path, "rb") as infile:
+            records = np.load(infile)
+            if records.dtype[0].kind == "U":
+                return records, None
+            return records, np.load(infile).tobytes().decode().split("\0")
+
+    def _to_frame(self, records: np.ndarray, strings: np.ndarray) -> pd.DataFrame:
+        # Taking from the table only copies references, every distinct string is built once
+        return pd.DataFrame(
+            {
+                col: strings[records[col]] if col in self.string_columns else records[col]
+                for col in records.dtype.names
+            }
+        )
+
+    def load(self, path: str) -> pd.DataFrame:
+        records, strings = self._read(path)
+        if strings is None:
+            return pd.DataFrame({col: records[col] for col in records.dtype.names})
+        return self._to_frame(records, np.array(strings, dtype=object))
+
+    def load_many(self, paths: list) -> pd.DataFrame:
+        """Concatenates the partitions' codes and tables, then builds a single dataframe"""
+        partitions = []
+        for path in paths:
+            try:
+                partitions.append(self._read(path))
+            except FileNotFoundError:
+                continue
+        if len(partitions) == 0:
+            return None
+        if any(strings is None for _, strings in partitions):
+            # Some partitions predate interning and have no parsed columns
+            return super().load_many(paths)[self.string_columns]
+
+        all_records, all_strings = [], []
+        for records, strings in partitions:
+            records = records.copy()
+            for col in self.string_columns:
+                records[col] += len(all_strings)
+            all_records.append(records)
+            all_strings += strings
+        return self._to_frame(np.concatenate(all_records), np.array(all_strings, dtype=object))
+
+
+class FeatherSerializer(Serializer):
+    """Arrow IPC partitions, memory-mapped on load, needs pyarrow"""
+
+    suffix = ".feather"
+
+    def dump(self, schedule: pd.DataFrame, path: str) -> None:
+        schedule.reset_index(drop=True).to_feather(path)
+
+    def load(self, path: str) -> pd.DataFrame:
+        return pd.read_feather(path, memory_map=True)
+
+
+SERIALIZERS = {
+    "csv": CsvSerializer,
+    "npy": NpySerializer,
+    "feather": FeatherSerializer,
+}
+
+
+def get_serializer(cache_format: str):
+    """
+    Returns the serializer for a cache format
+
+    Feather needs pyarrow, without it the cache falls back to npy.
+    """
+    if cache_format == "feather" and not HAS_PYARROW:
+        cache_format = "npy"
+    if cache_format not in SERIALIZERS:
+        raise ValueError(
+            f"Unknown cache format {cache_format}, expected one of {list(SERIALIZERS)}"
+        )
+    return SERIALIZERS[cache_format]()
@@ -0,0 +1,175 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from defaults.constants import Constants
+from etl.metrics import record_cache_lookup, timed
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCache:
+    """
+    Key-value cache shared by every worker process, in a local SQLite file in WAL mode
+
+    Values are pickled, so parsed schedules and computed availabilities can be reused
+    by the other workers. Per-key leases let one worker compute or fetch a value while
+    the others wait for it, instead of every cold worker hitting Amion at once. A
+    lease expires on its own, so a worker that dies while holding one doesn't block
+    the others for good.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        constants = Constants()
+        self.lease_seconds = constants.shared_cache_lease_seconds
+        self.wait_seconds = constants.shared_cache_wait_seconds
+        self.poll_seconds = constants.shared_cache_poll_seconds
+        self._local = threading.local()
+        self._writes = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS leases "
+                "(key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, sqlite3 connections can't be shared between threads"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _owner(self) -> str:
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def get(self, key: str):
+        """The cached value of key, None if it is missing or expired"""
+        row = (
+            self._connection()
+            .execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None or row[1] < time.time():
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value, ttl: float) -> None:
+        """Caches value under key for ttl seconds"""
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now + ttl),
+        )
+        # Drop expired entries every so often so the file doesn't keep growing
+        self._writes += 1
+        if self._writes % 100 == 0:
+            connection.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+
+    def delete(self, key: str) -> None:
+        self._connection().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self, prefix: str = "") -> None:
+        """Deletes every entry whose key starts with prefix, every entry by default"""
+        self._connection().execute(
+            "DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+        )
+
+    def acquire(self, key: str) -> bool:
+        """Takes the lease on key if nobody else holds an unexpired one"""
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+            cursor = connection.execute(
+                "INSERT OR IGNORE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, self._owner(), now + self.lease_seconds),
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return cursor.rowcount == 1
+
+    def release(self, key: str) -> None:
+        self._connection().execute(
+            "DELETE FROM leases WHERE key = ? AND owner = ?", (key, self._owner())
+        )
+
+    @contextmanager
+    def lock(self, key: str):
+        """
+        Holds the lease on key for the with block, waiting while another worker has it
+
+        If the lease isn't free after the wait, the block runs anyway rather than
+        failing the request.
+        """
+        waited_until = time.time() + self.wait_seconds
+        acquired = self.acquire(key)
+        while not acquired and time.time() < waited_until:
+            time.sleep(self.poll_seconds)
+            acquired = self.acquire(key)
+        if not acquired:
+            logger.warning("gave up waiting for the lease on %s", key)
+        try:
+            yield
+        finally:
+            if acquired:
+                self.release(key)
+
+    def get_or_compute(self, key: str, compute, ttl: float, cache: str = "shared"):
+        """
+        Returns the cached value of key, computing it in only one worker at a time
+
+        Args:
+            key: String cache key
+            compute: Callable without arguments returning the value
+            ttl: Float seconds to keep the value
+            cache: String name of the cache for the hit/miss counters
+
+        Returns:
+            The cached or computed value
+        """
+        value = self.get(key)
+        if value is None:
+            with self.lock(key):
+                # Another worker may have computed it while this one waited
+                value = self.get(key)
+                if value is None:
+                    record_cache_lookup(cache, misses=1)
+                    value = compute()
+                    with timed("shared_cache_write"):
+                        self.set(key, value, ttl)
+                    return value
+        record_cache_lookup(cache, hits=1)
+        return value
+
+
+_shared_caches = {}
+_shared_caches_lock = threading.Lock()
+
+
+def get_shared_cache(path: str = None) -> SharedCache:
+    """Returns the SharedCache of a file, by default shared.sqlite3 in the schedule cache"""
+    if path is None:
+        constants = Constants()
+        path = constants.shared_cache_path or f"{constants.cache_dir}/shared.sqlite3"
+    with _shared_caches_lock:
+        if path not in _shared_caches:
+            _shared_caches[path] = SharedCache(path)
+        return _shared_caches[path]
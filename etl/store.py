@@ -0,0 +1,317 @@
+import bisect
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+
+from defaults.constants import Constants
+from etl.serializers import military_to_minutes
+
+MINUTES_PER_DAY = 24 * 60
+
+
+class NameDirectory:
+    """
+    Sorted names of everyone on a schedule window, grouped by staff type
+
+    "All" holds everyone with one of the allowed staff types. Names can also be
+    searched by a case-insensitive prefix of their full name or of any word in it, for
+    type-ahead on programs with hundreds of residents.
+    """
+
+    def __init__(self, names_by_staff_type: dict):
+        self.names_by_staff_type = names_by_staff_type
+        self._search_keys = {}
+
+    def names(self, staff_type: str = "All") -> list:
+        return self.names_by_staff_type.get(staff_type, [])
+
+    def search(self, prefix: str, staff_type: str = "All", limit: int = None) -> list:
+        """
+        Names with a full name or a word starting with prefix
+
+        Args:
+            prefix: String to match, case-insensitive
+            staff_type: String staff type to search, "All" for every allowed staff type
+            limit: Int maximum number of names to return, every match if None
+
+        Returns:
+            Sorted list of matching names
+        """
+        if staff_type not in self._search_keys:
+            # One (lowercased word, name) key per word of each name, sorted for bisect
+            self._search_keys[staff_type] = sorted(
+                (word, name)
+                for name in self.names(staff_type)
+                for word in set([name.lower()] + re.split(r"[,\s]+", name.lower())[1:])
+                if word != ""
+            )
+        keys = self._search_keys[staff_type]
+        prefix = prefix.strip().lower()
+
+        matches = set()
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            matches.add(keys[i][1])
+            i += 1
+        return sorted(matches)[:limit]
+
+
+class ScheduleStore:
+    """
+    Normalized, columnar copy of a raw Amion schedule
+
+    The raw 625c rows are parsed once: names, teams and staff types are interned into
+    integer codes and shift times are converted to integer minutes since the epoch,
+    with the 24 hour and overnight shift fixes already applied. Routes read slices of
+    the store instead of re-cleaning the raw strings on every request.
+    """
+
+    def __init__(self, raw_schedule: pd.DataFrame, version: str = ""):
+        self.version = version
+        raw_schedule = raw_schedule.reset_index(drop=True)
+
+        # Every row, used to list who is on the schedule
+        name_codes, self.names = pd.factorize(raw_schedule["name"].astype(str), sort=True)
+        staff_type_codes, self.staff_types = pd.factorize(raw_schedule["staff_type"], sort=True)
+        self.roster_names = name_codes.astype(np.int32)
+        self.roster_staff_types = staff_type_codes.astype(np.int32)
+        # Partitions read from the npy cache come with the dates and times already parsed
+        if "day" in raw_schedule.columns:
+            self.roster_days = raw_schedule["day"].to_numpy(dtype=np.int64)
+        else:
+            self.roster_days = self._parse_days(raw_schedule["date"])
+
+        # Shifts that count as working
+        is_shift = (raw_schedule["grouping"].isin(["On Call", "Clinic"])) & (
+            raw_schedule["staff_type"].isin(Constants().allowed_staff_types)
+        )
+        shifts = raw_schedule[is_shift][["name", "team", "date", "start_time", "end_time"]].copy()
+        shifts["name_code"] = name_codes[is_shift.to_numpy()]
+        shifts["day"] = self.roster_days[is_shift.to_numpy()]
+        if "start_minute" in raw_schedule.columns:
+            shifts["start_minute"] = raw_schedule["start_minute"][is_shift].to_numpy(dtype=float)
+            shifts["end_minute"] = raw_schedule["end_minute"][is_shift].to_numpy(dtype=float)
+        else:
+            shifts["start_minute"] = military_to_minutes(shifts["start_time"])
+            shifts["end_minute"] = military_to_minutes(shifts["end_time"])
+        shifts = shifts.dropna(subset=["start_minute", "end_minute"])
+
+        # Handling weirdness in the data:
+        # If you are team 4/5, it can show as 2 lines
+        shift_keys = ["name_code", "day", "start_minute", "end_minute"]
+        # Only the few duplicated shifts need their teams joined
+        shifts["team"] = shifts["team"].astype(str)
+        group_ids = shifts.groupby(shift_keys, sort=False).ngroup()
+        duplicated = group_ids.duplicated(keep=False)
+        if duplicated.any():
+            shifts.loc[duplicated, "team"] = (
+                shifts[duplicated].groupby(group_ids[duplicated])["team"].transform(", ".join)
+            )
+        shifts = shifts.drop_duplicates(subset=shift_keys + ["team"])
+        team_codes, self.teams = pd.factorize(shifts["team"], sort=True)
+
+        self.shift_names = shifts["name_code"].to_numpy(dtype=np.int32)
+        self.shift_teams = team_codes.astype(np.int32)
+        self.shift_days = shifts["day"].to_numpy(dtype=np.int64)
+        self.shift_starts = self.shift_days * MINUTES_PER_DAY + shifts["start_minute"].to_numpy(
+            dtype=np.int64
+        )
+        self.shift_ends = self.shift_days * MINUTES_PER_DAY + shifts["end_minute"].to_numpy(
+            dtype=np.int64
+        )
+
+        # If start_time and end_time are the same, it's because its a 24 hr shift
+        # If start time is later in the day then end time, then it's a night shift
+        overnight = self.shift_starts >= self.shift_ends
+        self.shift_ends[overnight] += MINUTES_PER_DAY
+
+        self._build_shift_index()
+        self._name_directories = {}
+
+    def _build_shift_index(self) -> None:
+        """
+        Sorts the shifts by (person, start) so a person's shifts in a time range are
+        found with a binary search instead of a scan of the whole schedule
+        """
+        order = np.lexsort((self.shift_starts, self.shift_names))
+        for attr in ["shift_names", "shift_teams", "shift_days", "shift_starts", "shift_ends"]:
+            setattr(self, attr, getattr(self, attr)[order])
+
+        # One sorted int64 key per shift: person code in the high bits, start in the low bits
+        self._min_start = int(self.shift_starts.min()) if len(self.shift_starts) > 0 else 0
+        self._shift_keys = (self.shift_names.astype(np.int64) << 32) | (
+            self.shift_starts - self._min_start
+        )
+        if len(self.shift_starts) > 0:
+            self._max_shift_minutes = int((self.shift_ends - self.shift_starts).max())
+        else:
+            self._max_shift_minutes = 0
+
+    def _range_keys(self, name_codes: np.ndarray, minute: int) -> np.ndarray:
+        offset = np.clip(minute - self._min_start, 0, (1 << 32) - 1)
+        return (name_codes.astype(np.int64) << 32) | offset
+
+    def shift_indexes(
+        self,
+        names: list,
+        start_minute: int = None,
+        end_minute: int = None,
+        overlapping: bool = False,
+    ) -> np.ndarray:
+        """
+        Positions of a set of people's shifts in a time range
+
+        Args:
+            names: List of names to select, every name if empty
+            start_minute: Int minutes since the epoch the range starts at, no range if None
+            end_minute: Int minutes since the epoch the range ends before
+            overlapping: Bool, select every shift overlapping the range instead of only
+                the shifts starting in it
+
+        Returns:
+            Int array of shift positions, sorted by person and start
+        """
+        if len(names) > 0:
+            name_codes = np.flatnonzero(np.isin(self.names, names))
+        else:
+            name_codes = np.arange(len(self.names))
+        if start_minute is None:
+            lower = np.searchsorted(self.shift_names, name_codes, side="left")
+            upper = np.searchsorted(self.shift_names, name_codes, side="right")
+        else:
+            # A shift overlapping the range can't start earlier than the longest shift
+            lookback = self._max_shift_minutes if overlapping else 0
+            lower = np.searchsorted(
+                self._shift_keys, self._range_keys(name_codes, start_minute - lookback)
+            )
+            upper = np.searchsorted(self._shift_keys, self._range_keys(name_codes, end_minute))
+
+        indexes = np.concatenate(
+            [np.arange(first, last) for first, last in zip(lower, upper)] + [np.array([], int)]
+        ).astype(np.int64)
+        if overlapping and start_minute is not None:
+            indexes = indexes[self.shift_ends[indexes] > start_minute]
+        return indexes
+
+    def fingerprint(self, names: list, start_day: int = None, n_days: int = None) -> str:
+        """
+        Hash of the given people's shifts in a window
+
+        It only changes when one of their shifts running into the window changes, so
+        results keyed on it survive schedule refreshes that only touched other people.
+
+        Args:
+            names: List of names
+            start_day: Int days since the epoch of the first date, every date if None
+            n_days: Int number of dates
+
+        Returns:
+            String hex digest
+        """
+        if start_day is None:
+            selected = self.shift_indexes(names=names)
+        else:
+            selected = self.shift_indexes(
+                names=names,
+                start_minute=start_day * MINUTES_PER_DAY,
+                end_minute=(start_day + n_days) * MINUTES_PER_DAY,
+                overlapping=True,
+            )
+        # Shift name codes depend on everyone on the schedule, so hash the names instead
+        digest = hashlib.sha1("\n".join(sorted(set(names))).encode())
+        digest.update("\n".join(self.names[self.shift_names[selected]]).encode())
+        digest.update(self.shift_starts[selected].tobytes())
+        digest.update(self.shift_ends[selected].tobytes())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _parse_days(dates: pd.Series) -> np.ndarray:
+        """Parses each distinct "%m-%d-%y" date once and returns days since the epoch"""
+        date_codes, unique_dates = pd.factorize(dates.astype(str))
+        parsed = pd.to_datetime(pd.Series(unique_dates), format="%m-%d-%y")
+        unique_days = (parsed - pd.Timestamp(0)) // pd.Timedelta(days=1)
+        return unique_days.to_numpy(dtype=np.int64)[date_codes]
+
+    def _day_mask(self, days: np.ndarray, start_day: int = None, n_days: int = None) -> np.ndarray:
+        if start_day is None:
+            return np.ones(len(days), dtype=bool)
+        return (days >= start_day) & (days < start_day + n_days)
+
+    def unique_names(self, staff_types: list, start_day: int = None, n_days: int = None) -> list:
+        """Sorted names of everyone with one of the staff types on the schedule"""
+        staff_type_codes = np.flatnonzero(np.isin(self.staff_types, staff_types))
+        in_scope = np.isin(self.roster_staff_types, staff_type_codes) & self._day_mask(
+            self.roster_days, start_day, n_days
+        )
+        return list(self.names[np.unique(self.roster_names[in_scope])])
+
+    def name_directory(self, start_day: int = None, n_days: int = None) -> NameDirectory:
+        """
+        Names on the schedule grouped by staff type, built once per window
+
+        Args:
+            start_day: Int days since the epoch of the first date to select
+            n_days: Int number of dates to select
+
+        Returns:
+            NameDirectory of the window
+        """
+        window = (start_day, n_days)
+        if window not in self._name_directories:
+            in_scope = self._day_mask(self.roster_days, start_day, n_days)
+            staff_type_codes = self.roster_staff_types[in_scope]
+            name_codes = self.roster_names[in_scope]
+            names_by_staff_type = {
+                self.staff_types[code]: list(
+                    self.names[np.unique(name_codes[staff_type_codes == code])]
+                )
+                for code in np.unique(staff_type_codes)
+            }
+            allowed = np.isin(
+                staff_type_codes,
+                np.flatnonzero(np.isin(self.staff_types, Constants().allowed_staff_types)),
+            )
+            names_by_staff_type["All"] = list(self.names[np.unique(name_codes[allowed])])
+            self._name_directories[window] = NameDirectory(names_by_staff_type)
+        return self._name_directories[window]
+
+    def shifts(
+        self,
+        names: list,
+        start_day: int = None,
+        n_days: int = None,
+        overlapping: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Cleaned shifts of the given people
+
+        Args:
+            names: List of names to select, every name if empty
+            start_day: Int days since the epoch of the first date to select
+            n_days: Int number of dates to select
+            overlapping: Bool, also select shifts from earlier dates running into the
+                first date, instead of only the shifts dated in the range
+
+        Returns:
+            Dataframe with name, team, start_time and end_time of every shift
+        """
+        if start_day is None:
+            selected = self.shift_indexes(names=names)
+        else:
+            selected = self.shift_indexes(
+                names=names,
+                start_minute=start_day * MINUTES_PER_DAY,
+                end_minute=(start_day + n_days) * MINUTES_PER_DAY,
+                overlapping=overlapping,
+            )
+
+        return pd.DataFrame(
+            {
+                "name": self.names[self.shift_names[selected]],
+                "team": self.teams[self.shift_teams[selected]],
+                "start_time": pd.to_datetime(self.shift_starts[selected], unit="m"),
+                "end_time": pd.to_datetime(self.shift_ends[selected], unit="m"),
+            }
+        )
@@ -1,10 +1,28 @@
 import pandas as pd
-import requests
 import datetime as dt
 import csv
-import os
-from typing import Tuple
+import itertools
+import logging
+import hashlib
+import requests
 from defaults.constants import Constants
+from etl.store import NameDirectory, ScheduleStore
+from etl.cache import ScheduleCache, missing_runs
+from etl.lru import LRUCache
+from etl.amion import (
+    AmionClient,
+    fan_out,
+    get_client,
+    response_lines,
+    split_login_codes,
+)
+from etl.metrics import amion_errors, record_cache_lookup, timed
+from etl.shared_cache import get_shared_cache
+
+logger = logging.getLogger(__name__)
+
+# Normalized schedules already parsed in this process, keyed by login code
+_schedule_stores = LRUCache(maxsize=Constants().schedule_store_cache_size)
 
 
 def request_amion(
@@ -15,59 +33,71 @@ def request_amion(
     days: int = 0,
     return_dataframe: bool = True,
 ):
-    url_prefix = "http://www.amion.com/cgi-bin/ocs?"
-    url = f"{url_prefix}Lo={login_code}&Rpt=625c"
-    if start_year != 0:
-        url = (
-            url
-            + f"&Day={str(start_day)}&Month={str(start_month)}&Year={str(start_year)}&Days={str(days)}"
-        )
-    print(f"url: {url}")
-    response = requests.get(url=url, headers={"Connection": "close"})
-
-    if return_dataframe:
-        raw_schedule_list = response.text.split("\n")[7:]
-
-        schedule_cols = [
-            "name",
-            "name_id1",
-            "name_id2",
-            "team",
-            "team_id1",
-            "team_id2",
-            "date",
-            "start_time",
-            "end_time",
-            "staff_type",
-            "pager_number",
-            "tel_extension",
-            "email",
-            "col1",
-            "col2",
-            "col3",
-            "grouping",
-        ]
+    client = get_client()
+    url = client.url(
+        login_code=login_code,
+        start_year=start_year,
+        start_month=start_month,
+        start_day=start_day,
+        days=days,
+    )
+    logger.info("requesting %s", url)
 
-        df_list = []
-        for row in csv.reader(raw_schedule_list, delimiter=","):
-            if len(row) > 0:
-                df_list.append(row)
-        schedule_df = pd.DataFrame(df_list, columns=schedule_cols)
-        print(f"requested schedule from API row count: {schedule_df.shape[0]}")
-
-        return schedule_df[
-            [
-                "name",
-                "team",
-                "date",
-                "staff_type",
-                "start_time",
-                "end_time",
-                "grouping",
-            ]
-        ]
+    with timed("request_amion"):
+        if return_dataframe:
+            schedule_df = client.coalesce(url, lambda: stream_625c(client=client, url=url))
+            logger.info("requested schedule from API row count: %d", schedule_df.shape[0])
+            return schedule_df
+
+        return client.coalesce(("raw", url), lambda: client.get(url=url))
+
+
+def stream_625c(client: AmionClient, url: str) -> pd.DataFrame:
+    """Requests a 625c report and parses it while it downloads"""
+    with client.stream(url=url) as response:
+        return parse_625c(response_lines(response))
+
+
+def parse_625c(lines) -> pd.DataFrame:
+    """
+    Parses the lines of an Amion 625c report as they stream in
+
+    Only the columns the app uses are kept. Each one is appended to its own buffer
+    while the rows are read, so the full report and its unused columns are never
+    held in memory.
+
+    Args:
+        lines: Iterable of the report's text lines
+
+    Returns:
+        Pandas dataframe of raw schedule
+    """
+    # Position of each kept column out of the 17 columns in the report:
+    # name, name_id1, name_id2, team, team_id1, team_id2, date, start_time, end_time,
+    # staff_type, pager_number, tel_extension, email, col1, col2, col3, grouping
+    schedule_col_positions = {
+        "name": 0,
+        "team": 3,
+        "date": 6,
+        "staff_type": 9,
+        "start_time": 7,
+        "end_time": 8,
+        "grouping": 16,
+    }
+    row_length = max(schedule_col_positions.values()) + 1
+    buffers = {col: [] for col in schedule_col_positions}
+    appenders = [
+        (buffers[col].append, position) for col, position in schedule_col_positions.items()
+    ]
+
+    # The first 7 lines are the report header
+    for row in csv.reader(itertools.islice(lines, 7, None), delimiter=","):
+        if len(row) < row_length:
+            continue
+        for append, position in appenders:
+            append(row[position])
 
-    return response
+    return pd.DataFrame(buffers)
 
 
 def parse_dates(start_date: str, end_date: str):
@@ -94,9 +124,25 @@ def parse_dates(start_date: str, end_date: str):
     }
 
 
-def validate_login_code(login_code: str):
-    response = request_amion(login_code=login_code, return_dataframe=False)
-    return "bad password" not in response.text.lower()
+def get_name_directory(login_code: str, start_date: str, end_date: str) -> NameDirectory:
+    """
+    Returns the names on the schedule between two dates, grouped by staff type
+
+    The directory is built once per schedule version and window, so the filter page
+    and type-ahead searches don't rescan the schedule.
+    """
+    parsed_dates = parse_dates(start_date=start_date, end_date=end_date)
+    schedule_store = get_schedule_store(
+        login_code=login_code,
+        start_year=parsed_dates["start_year"],
+        start_month=parsed_dates["start_month"],
+        start_day=parsed_dates["start_day"],
+        days=parsed_dates["days"],
+    )
+    return schedule_store.name_directory(
+        start_day=(parsed_dates["start_date"] - dt.datetime(1970, 1, 1)).days,
+        n_days=parsed_dates["days"],
+    )
 
 
 def get_unique_names(
@@ -105,51 +151,120 @@ def get_unique_names(
     end_date: str,
     staff_types: str = "All",
 ):
-    parsed_dates = parse_dates(start_date=start_date, end_date=end_date)
-    response_df = get_schedule(
-        login_code=login_code,
-        start_year=parsed_dates["start_year"],
-        start_month=parsed_dates["start_month"],
-        start_day=parsed_dates["start_day"],
-        days=parsed_dates["days"],
+    name_directory = get_name_directory(
+        login_code=login_code, start_date=start_date, end_date=end_date
     )
+    return name_directory.names(staff_type=staff_types)
 
-    if staff_types == "All":
-        staff_types = Constants().allowed_staff_types
-    else:
-        staff_types = [staff_types]
 
-    names = list(
-        response_df[response_df["staff_type"].isin(staff_types)].name.sort_values().unique()
+def fetch_schedule(login_code: str, days: list, max_age: float = None) -> set:
+    """
+    Requests the dates that aren't cached yet from Amion API and caches them
+
+    Long runs of dates are split into chunks that are fetched in parallel and cached
+    as soon as each one arrives. Chunks that fail are retried on their own, so one bad
+    response doesn't throw away the rest of the window.
+
+    Args:
+        login_code: amion login_code ex: "chla"
+        days: List of dates that need to be cached
+        max_age: Float seconds after which cached dates are requested again, the TTL if None
+
+    Returns:
+        Set of names of everyone whose shifts changed since the dates were last cached
+    """
+    constants = Constants()
+    cache = ScheduleCache()
+    changed = set()
+    missing_days = cache.missing_days(login_code, days, max_age)
+    record_cache_lookup(
+        "schedule_days", hits=len(days) - len(missing_days), misses=len(missing_days)
     )
-    return names
+    chunks = missing_runs(missing_days, max_days=constants.amion_chunk_days)
+
+    shared_cache = get_shared_cache()
 
+    def fetch_chunk(chunk):
+        run_start, run_days = chunk
+        chunk_days = [run_start + dt.timedelta(i) for i in range(run_days)]
+        # Only one worker fetches a chunk, the others wait and then read what it cached
+        with shared_cache.lock(f"fetch:{login_code}:{run_start}:{run_days}"):
+            if len(cache.missing_days(login_code, chunk_days, max_age)) == 0:
+                return None
+            try:
+                schedule_df = request_amion(
+                    login_code=login_code,
+                    start_year=run_start.year,
+                    start_month=run_start.month,
+                    start_day=run_start.day,
+                    days=run_days,
+                )
+            except requests.RequestException as e:
+                logger.warning("fetching %d days from %s failed: %s", run_days, run_start, e)
+                amion_errors.inc()
+                return e
+            # Write requested data to cache
+            changed.update(
+                cache.write(login_code=login_code, days=chunk_days, schedule=schedule_df)
+            )
+        return None
 
-def get_cache_path(
+    failures = []
+    for _ in range(constants.amion_chunk_retries + 1):
+        failures = [
+            (chunk, error)
+            for chunk, error in zip(chunks, fan_out(fetch_chunk, chunks))
+            if error is not None
+        ]
+        chunks = [chunk for chunk, _ in failures]
+        if len(chunks) == 0:
+            break
+    if len(failures) > 0:
+        raise failures[0][1]
+    if len(changed) > 0:
+        logger.info("%d people changed in %s", len(changed), login_code)
+    return changed
+
+
+def get_schedule(
     login_code: str,
     start_year: int,
     start_month: int,
     start_day: int,
     days: int,
-):
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    prev_dir = "/".join(current_dir.split("/")[:-1])
-    cache_prefix = f"{prev_dir}/_cache"
-    cache_path = f"{cache_prefix}/login={login_code}_start={start_year}{start_month}{start_day}_days={days}.csv"
-    print(cache_path)
-    return cache_path
+) -> pd.DataFrame:
+    """
+    Requests data from Amion API, only for dates that aren't cached yet
 
+    Args:
+        login_code: amion login_code ex: "chla"
+        start_year: Int of year to start query
+        start_month: Int of month to start query
+        start_day: Int of day to start query
+        days: Int of number of days from from start to complete search
 
-def get_schedule(
+    Returns:
+        Pandas dataframe of raw schedule
+    """
+    start = dt.date(start_year, start_month, start_day)
+    requested_days = [start + dt.timedelta(i) for i in range(days)]
+    fetch_schedule(login_code=login_code, days=requested_days)
+    return ScheduleCache().read(login_code=login_code, days=requested_days)
+
+
+def get_schedule_store(
     login_code: str,
     start_year: int,
     start_month: int,
     start_day: int,
     days: int,
-    return_dataframe: bool = True,
-) -> Tuple[list, pd.DataFrame]:
+    max_age: float = None,
+) -> ScheduleStore:
     """
-    Requests data from Amion API
+    Returns the normalized schedule of a login code, covering at least the queried dates
+
+    The store holds every cached date of the login code and is only re-parsed when
+    the cache changes, so it is shared by every query window.
 
     Args:
         login_code: amion login_code ex: "chla"
@@ -157,34 +272,113 @@ def get_schedule(
         start_month: Int of month to start query
         start_day: Int of day to start query
         days: Int of number of days from from start to complete search
+        max_age: Float seconds after which cached dates are requested again, the TTL if None
 
     Returns:
-        Pandas dataframe of raw schedule
+        ScheduleStore of the schedule
     """
-    cache_path = get_cache_path(
+    login_codes = split_login_codes(login_code)
+    if len(login_codes) > 1:
+        return get_combined_schedule_store(
+            login_codes=login_codes,
+            start_year=start_year,
+            start_month=start_month,
+            start_day=start_day,
+            days=days,
+            max_age=max_age,
+        )
+    if len(login_codes) == 1:
+        login_code = login_codes[0]
+
+    start = dt.date(start_year, start_month, start_day)
+    fetch_schedule(
         login_code=login_code,
-        start_year=start_year,
-        start_month=start_month,
-        start_day=start_day,
-        days=days,
+        days=[start + dt.timedelta(i) for i in range(days)],
+        max_age=max_age,
     )
-    if os.path.isfile(cache_path):
-        print(f"reading from cache at {cache_path}")
-        cache_df = pd.read_csv(cache_path)
-        return cache_df
 
-    schedule_df = request_amion(
-        login_code=login_code,
-        start_year=start_year,
-        start_month=start_month,
-        start_day=start_day,
-        days=days,
-        return_dataframe=return_dataframe,
+    cache = ScheduleCache()
+    version = cache.version(login_code)
+    cached_version, store = _schedule_stores.get(login_code, (None, None))
+    if cached_version != version:
+        record_cache_lookup("schedule_store", misses=1)
+        store = get_shared_cache().get_or_compute(
+            f"store:{login_code}:{version}",
+            lambda: build_schedule_store(
+                raw_schedule=cache.read(login_code=login_code), version=version
+            ),
+            ttl=Constants().shared_cache_ttl_seconds,
+            cache="shared_schedule_store",
+        )
+        _schedule_stores.put(login_code, (version, store))
+    else:
+        record_cache_lookup("schedule_store", hits=1)
+    return store
+
+
+@timed("build_store")
+def build_schedule_store(raw_schedule: pd.DataFrame, version: str) -> ScheduleStore:
+    return ScheduleStore(raw_schedule=raw_schedule, version=version)
+
+
+def get_combined_schedule_store(
+    login_codes: list,
+    start_year: int,
+    start_month: int,
+    start_day: int,
+    days: int,
+    max_age: float = None,
+) -> ScheduleStore:
+    """
+    Returns one normalized schedule combining several access codes
+
+    The access codes are fetched concurrently, then their cached schedules are merged
+    into a single store, so people in several programs get their shifts from all of
+    them. The merged store is only rebuilt when one of the access codes changes.
+
+    Args:
+        login_codes: List of amion login_codes ex: ["chla", "cho"]
+        start_year: Int of year to start query
+        start_month: Int of month to start query
+        start_day: Int of day to start query
+        days: Int of number of days from from start to complete search
+        max_age: Float seconds after which cached dates are requested again, the TTL if None
+
+    Returns:
+        ScheduleStore of the combined schedule
+    """
+    # Sorted, so "chla,cho" and "cho,chla" share one combined store
+    login_codes = sorted(login_codes)
+    stores = fan_out(
+        lambda code: get_schedule_store(
+            login_code=code,
+            start_year=start_year,
+            start_month=start_month,
+            start_day=start_day,
+            days=days,
+            max_age=max_age,
+        ),
+        login_codes,
     )
-    print(f"schedule row count: {schedule_df.shape[0]}")
-    # Write requested data to cache
-    outfile = open(cache_path, "wb")
-    schedule_df.to_csv(outfile)
-    outfile.close()
 
-    return schedule_df
+    combined_code = ",".join(login_codes)
+    version = hashlib.sha1(
+        "\n".join(f"{code}:{store.version}" for code, store in zip(login_codes, stores)).encode()
+    ).hexdigest()[:16]
+    cached_version, store = _schedule_stores.get(combined_code, (None, None))
+    if cached_version != version:
+        cache = ScheduleCache()
+        store = get_shared_cache().get_or_compute(
+            f"store:{combined_code}:{version}",
+            lambda: build_schedule_store(
+                raw_schedule=pd.concat(
+                    [cache.read(login_code=code) for code in login_codes],
+                    ignore_index=True,
+                ),
+                version=version,
+            ),
+            ttl=Constants().shared_cache_ttl_seconds,
+            cache="shared_schedule_store",
+        )
+        _schedule_stores.put(combined_code, (version, store))
+    return store
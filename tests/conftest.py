@@ -0,0 +1,34 @@
+import pytest
+
+import etl.amion
+from benchmarks.amion_server import AmionStandIn
+from etl.lru import LRUCache
+
+
+@pytest.fixture
+def stand_in():
+    """Starts local Amion stand-ins, stopping them after the test"""
+    stand_ins = []
+
+    def start(schedules: dict, **kwargs) -> AmionStandIn:
+        stand_ins.append(AmionStandIn(schedules=schedules, **kwargs).start())
+        return stand_ins[-1]
+
+    yield start
+    for server in stand_ins:
+        server.stop()
+
+
+@pytest.fixture
+def amion_env(monkeypatch, tmp_path):
+    """Points the app at a stand-in and a fresh cache, returns a function taking its URL"""
+
+    def configure(url: str) -> None:
+        monkeypatch.setenv("AMION_URL", url)
+        monkeypatch.setenv("CACHE_DIR", str(tmp_path / "cache"))
+        monkeypatch.setenv("PREFETCH_ENABLED", "0")
+        # The shared client reads AMION_URL when it is first created
+        monkeypatch.setattr(etl.amion, "_client", None)
+        monkeypatch.setattr(etl.amion, "_login_code_checks", LRUCache(maxsize=8))
+
+    return configure
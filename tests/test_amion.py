@@ -0,0 +1,161 @@
+import datetime as dt
+import os
+import threading
+import time
+
+import pytest
+import requests
+
+import etl.amion
+
+from benchmarks.amion_server import load_payloads
+from benchmarks.fixtures import render_625c, synthetic_schedule
+from etl.amion import AmionClient, probe_login_code, validate_login_code
+from etl.cache import SCHEDULE_COLS
+from etl.metrics import amion_errors
+from etl.utils import get_schedule_store, request_amion, stream_625c
+
+PAYLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+
+
+@pytest.fixture
+def recorded(stand_in):
+    """Stand-in serving the recorded 625c payloads, returns a function taking its options"""
+    return lambda **kwargs: stand_in(load_payloads(PAYLOAD_DIR), **kwargs)
+
+
+def test_stream_625c_parses_recorded_payload(recorded):
+    server = recorded()
+    client = AmionClient(base_url=server.url, retries=0)
+
+    parsed = stream_625c(client=client, url=client.url(login_code="chla"))
+
+    assert parsed[SCHEDULE_COLS].equals(server.schedules["chla"][SCHEDULE_COLS])
+
+
+def test_stream_625c_header_newline_on_chunk_boundary(stand_in):
+    schedule = synthetic_schedule(residents=5, days=3, start=dt.date(2023, 8, 1))
+    # Pad the title so the 5th header line ends on the last byte of the first 512 byte chunk
+    fifth_newline = sum(len(line) + 1 for line in render_625c(schedule, "").split("\n")[:5]) - 1
+    payload = render_625c(schedule, title="x" * (511 - fifth_newline))
+    assert payload[511] == "\n" and payload.count("\n", 0, 511) == 4
+
+    server = stand_in({})
+    server.report = lambda query: payload
+    client = AmionClient(base_url=server.url, retries=0)
+
+    parsed = stream_625c(client=client, url=client.url(login_code="chunked"))
+
+    assert len(parsed) == len(schedule)
+    assert "Name" not in set(parsed["name"])
+    assert parsed[SCHEDULE_COLS].values.tolist() == schedule[SCHEDULE_COLS].values.tolist()
+
+
+def test_concurrent_identical_requests_are_coalesced(recorded, amion_env):
+    server = recorded(latency=0.3)
+    amion_env(server.url)
+    n_callers = 8
+    barrier = threading.Barrier(n_callers)
+    results = []
+
+    def call():
+        barrier.wait()
+        results.append(
+            request_amion(login_code="chla", start_year=2023, start_month=8, start_day=1, days=5)
+        )
+
+    threads = [threading.Thread(target=call) for _ in range(n_callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(server.requests) == 1
+    assert len(results) == n_callers
+    assert all(result.equals(results[0]) for result in results)
+
+
+def test_server_errors_are_retried_with_backoff(recorded):
+    server = recorded(fail_first=2)
+    client = AmionClient(base_url=server.url, retries=2, backoff=0.1)
+
+    start = time.perf_counter()
+    parsed = stream_625c(client=client, url=client.url(login_code="chla"))
+
+    assert len(server.requests) == 3
+    assert len(parsed) == len(server.schedules["chla"])
+    # urllib3 sleeps backoff * 2 ** (retry - 1) before every retry after the first
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_server_errors_fail_once_retries_run_out(recorded):
+    server = recorded(fail_first=5)
+    client = AmionClient(base_url=server.url, retries=1, backoff=0)
+
+    with pytest.raises(requests.RequestException):
+        stream_625c(client=client, url=client.url(login_code="chla"))
+    assert len(server.requests) == 2
+
+
+def test_slow_responses_time_out(recorded):
+    server = recorded(latency=1)
+    client = AmionClient(base_url=server.url, read_timeout=0.1, retries=0)
+
+    start = time.perf_counter()
+    with pytest.raises(requests.RequestException):
+        stream_625c(client=client, url=client.url(login_code="chla"))
+    assert time.perf_counter() - start < 0.9
+
+
+def test_cut_off_bodies_raise_requests_errors(recorded):
+    server = recorded(cut_off_first=1)
+    client = AmionClient(base_url=server.url, retries=0)
+
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        stream_625c(client=client, url=client.url(login_code="chla"))
+
+
+def test_cut_off_chunks_are_fetched_again(recorded, amion_env):
+    server = recorded(cut_off_first=1)
+    amion_env(server.url)
+    errors = amion_errors.value()
+
+    store = get_schedule_store(
+        login_code="chla", start_year=2023, start_month=8, start_day=1, days=5
+    )
+
+    assert len(server.requests) == 2
+    assert amion_errors.value() == errors + 1
+    assert set(store.names) == set(server.schedules["chla"]["name"])
+
+
+def test_probe_login_code_reads_bad_password_page(recorded, amion_env):
+    server = recorded()
+    amion_env(server.url)
+
+    assert probe_login_code("chla")
+    assert not probe_login_code("wrong")
+
+
+def test_validate_login_code_reuses_recent_checks(recorded, amion_env):
+    server = recorded()
+    amion_env(server.url)
+
+    assert validate_login_code("chla")
+    assert not validate_login_code("wrong")
+    assert validate_login_code("chla")
+    assert not validate_login_code("wrong")
+    assert len(server.requests) == 2
+
+
+def test_login_code_checks_are_bounded_and_normalized(recorded, amion_env):
+    server = recorded()
+    amion_env(server.url)
+
+    assert validate_login_code(" chla ")
+    assert validate_login_code("chla,")
+    assert len(server.requests) == 1
+
+    for i in range(20):
+        assert not validate_login_code(f"random{i}")
+    assert len(etl.amion._login_code_checks._entries) == 8
@@ -0,0 +1,113 @@
+import datetime as dt
+
+import pytest
+
+from benchmarks.fixtures import synthetic_schedule
+
+
+@pytest.fixture
+def client(stand_in, amion_env):
+    """Flask test client backed by a stand-in serving a "demo" schedule from today"""
+    schedule = synthetic_schedule(residents=10, days=30, start=dt.date.today())
+    amion_env(stand_in({"demo": schedule}).url)
+    from app import app
+
+    test_client = app.test_client()
+    test_client.names = sorted(set(schedule["name"]))[:3]
+    return test_client
+
+
+def select(client) -> str:
+    """Saves a selection through the filter page and returns the availability URL"""
+    today = dt.date.today()
+    response = client.post(
+        "/filter/access_code=demo&staff_type=All",
+        data={
+            "submit_button": "Submit",
+            "start_date": today.isoformat(),
+            "end_date": (today + dt.timedelta(14)).isoformat(),
+            "names": client.names,
+        },
+    )
+    assert response.status_code == 302
+    return response.location
+
+
+@pytest.mark.parametrize("resolution", ["15", "30", "60"])
+def test_availability_form_accepts_offered_resolutions(client, resolution):
+    response = client.post(
+        select(client), data={"start_time": "8", "end_time": "17", "resolution": resolution}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    "form",
+    [
+        {"start_time": "8", "end_time": "17", "resolution": "0"},
+        {"start_time": "8", "end_time": "17", "resolution": "sixty"},
+        {"start_time": "eight", "end_time": "17"},
+    ],
+)
+def test_availability_form_rejects_invalid_values(client, form):
+    assert client.post(select(client), data=form).status_code == 400
+
+
+def test_only_valid_access_codes_are_prefetched(client, monkeypatch):
+    import app as app_module
+    from etl.prefetch import PrefetchWorker
+
+    monkeypatch.setattr(app_module.constants, "prefetch_enabled", True)
+    monkeypatch.setattr(app_module, "prefetch_worker", PrefetchWorker())
+
+    assert client.get("/api/v1/names", query_string={"access_code": "demo"}).status_code == 200
+    client.get("/api/v1/names", query_string={"access_code": "unknown"})
+
+    assert app_module.prefetch_worker.active_login_codes() == ["demo"]
+
+
+def availability_query(client, **args) -> dict:
+    today = dt.date.today()
+    return dict(
+        access_code="demo",
+        start_date=today.isoformat(),
+        end_date=(today + dt.timedelta(14)).isoformat(),
+        names=client.names,
+        **args,
+    )
+
+
+@pytest.mark.parametrize("route", ["/api/v1/availability", "/api/v1/best_slots"])
+@pytest.mark.parametrize(
+    "times", [{"start_time": "25"}, {"end_time": "-1"}, {"start_time": "08"}, {"end_time": "x"}]
+)
+def test_apis_reject_hours_the_filter_doesnt_offer(client, route, times):
+    response = client.get(route, query_string=availability_query(client, **times))
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("times", [{"start_time": 25}, {"end_time": -1}, {"start_time": "08"}])
+def test_batch_api_rejects_hours_the_filter_doesnt_offer(client, times):
+    query = availability_query(client)
+    body = dict(query, groups=[dict(names=query.pop("names"), **times)])
+    assert client.post("/api/v1/availability/batch", json=body).status_code == 400
+
+
+def test_availability_api_answers_unchanged_polls_with_304(client):
+    query = availability_query(client, start_time="8", end_time="17")
+    response = client.get("/api/v1/availability", query_string=query)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    polled = client.get("/api/v1/availability", query_string=query, headers={"If-None-Match": etag})
+    assert polled.status_code == 304
+    assert polled.headers["ETag"] == etag
+    assert polled.data == b""
+
+    # A different query doesn't match the ETag
+    changed = client.get(
+        "/api/v1/availability",
+        query_string=dict(query, end_time="18"),
+        headers={"If-None-Match": etag},
+    )
+    assert changed.status_code == 200
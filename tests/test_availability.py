@@ -0,0 +1,113 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+
+from benchmarks.fixtures import synthetic_schedule
+from etl.get_schedule import Schedule
+from etl.store import ScheduleStore
+
+# Shifts covering the cases the old pandas pipeline handled, from 2023-08-01 to 2023-08-03
+FIXED_SCHEDULE = pd.DataFrame(
+    [
+        # 24 hour shift
+        ("Adams, Amy", "Team 1", "08-01-23", "PGY-1", "0700", "0700", "On Call"),
+        ("Adams, Amy", "Team 1", "08-03-23", "PGY-1", "0900", "1100", "Clinic"),
+        # Overnight shift
+        ("Baker, Ben", "Team 2", "08-02-23", "PGY-2", "1900", "0700", "On Call"),
+        # The same shift listed under Team 4 and Team 5
+        ("Chen, Cara", "Team 4", "08-01-23", "PGY-3", "1400", "1800", "Clinic"),
+        ("Chen, Cara", "Team 5", "08-01-23", "PGY-3", "1400", "1800", "Clinic"),
+        # Doesn't start on the hour
+        ("Chen, Cara", "Team 4", "08-03-23", "PGY-3", "1315", "1700", "Clinic"),
+    ],
+    columns=["name", "team", "date", "staff_type", "start_time", "end_time", "grouping"],
+)
+# Diaz has no shifts
+FIXED_NAMES = ["Adams, Amy", "Baker, Ben", "Chen, Cara", "Diaz, Dan"]
+FIXED_FINAL_NAMES = ["Adams, Amy", "Baker, Ben", "Chen, Cara", "Diaz, Dan*"]
+
+
+def block(start_time, end_time, display_time_range):
+    return {
+        "start_time": start_time,
+        "end_time": end_time,
+        "display_time_range": display_time_range,
+        "display_hour_range": f"({end_time - start_time} hours)",
+    }
+
+
+@pytest.mark.parametrize(
+    "start_time, end_time, availabilities",
+    [
+        (
+            "0",
+            "24",
+            {
+                "Aug 1 (Tue)": [block(0, 7, "12:00 AM to 7:00 AM")],
+                "Aug 2 (Wed)": [block(8, 19, "8:00 AM to 7:00 PM")],
+                "Aug 3 (Thu)": [
+                    block(8, 9, "8:00 AM to 9:00 AM"),
+                    block(12, 24, "12:00 PM to 11:59 PM"),
+                ],
+            },
+        ),
+        (
+            "8",
+            "17",
+            {
+                "Aug 2 (Wed)": [block(8, 18, "8:00 AM to 6:00 PM")],
+                "Aug 3 (Thu)": [
+                    block(8, 9, "8:00 AM to 9:00 AM"),
+                    block(12, 18, "12:00 PM to 6:00 PM"),
+                ],
+            },
+        ),
+    ],
+)
+def test_hourly_availability_matches_the_old_pipeline(start_time, end_time, availabilities):
+    # Expected results come from the pandas implementation this replaced
+    assert Schedule().compute_availability(
+        login_code="fixed",
+        schedule_store=ScheduleStore(FIXED_SCHEDULE),
+        start_date="2023-08-01",
+        end_date="2023-08-04",
+        names=FIXED_NAMES,
+        start_time=start_time,
+        end_time=end_time,
+    ) == (availabilities, FIXED_FINAL_NAMES)
+
+
+def free_minutes(availabilities: dict, shift: int = 0) -> set:
+    """(day, minute) pairs of the free blocks, with shift minutes cut off every block's start"""
+    return {
+        (day, minute)
+        for day, blocks in availabilities.items()
+        for block in blocks
+        for minute in range(int(block["start_time"] * 60) + shift, int(block["end_time"] * 60))
+    }
+
+
+def test_finer_resolutions_refine_hourly_availability():
+    schedule = synthetic_schedule(residents=30, days=14, start=dt.date(2023, 8, 1))
+    store = ScheduleStore(schedule)
+    names = sorted(set(schedule["name"]))[:3]
+
+    def availabilities(resolution):
+        return Schedule().compute_availability(
+            login_code="synthetic",
+            schedule_store=store,
+            start_date="2023-08-01",
+            end_date="2023-08-15",
+            names=names,
+            start_time="8",
+            end_time="17",
+            resolution=resolution,
+        )[0]
+
+    hourly = availabilities(60)
+    half_hourly = availabilities(30)
+    assert len(free_minutes(hourly)) > 0
+    # Free hours stay free, and the finer grid only adds the half hour after a shift ends
+    assert free_minutes(hourly) <= free_minutes(half_hourly)
+    assert free_minutes(half_hourly, shift=30) <= free_minutes(hourly)
@@ -0,0 +1,70 @@
+import datetime as dt
+import os
+import time
+
+import pytest
+
+from benchmarks.fixtures import synthetic_schedule
+from etl.cache import FETCHED_SUFFIX, ScheduleCache
+
+START = dt.date(2023, 8, 1)
+DAYS = [START + dt.timedelta(i) for i in range(5)]
+
+
+@pytest.fixture(params=["npy", "csv"])
+def cache(request, tmp_path):
+    return ScheduleCache(cache_dir=str(tmp_path), cache_format=request.param)
+
+
+def expire(cache: ScheduleCache, path: str) -> None:
+    old = time.time() - cache.ttl("demo") - 60
+    os.utime(f"{path}{FETCHED_SUFFIX}", (old, old))
+
+
+def test_unchanged_refresh_only_marks_partitions_fetched(cache):
+    schedule = synthetic_schedule(residents=5, days=len(DAYS), start=START)
+    cache.write("demo", DAYS, schedule)
+    version = cache.version("demo")
+    paths = [cache.partition_path("demo", day) for day in DAYS]
+    modified = [os.stat(path).st_mtime_ns for path in paths]
+    for path in paths:
+        expire(cache, path)
+    assert cache.missing_days("demo", DAYS) == DAYS
+
+    assert cache.write("demo", DAYS, schedule) == set()
+    # Reading marks partitions as recently used
+    assert len(cache.read("demo")) == len(schedule)
+
+    assert cache.missing_days("demo", DAYS) == []
+    # Content digests are memoized on the modified time, so they aren't read again
+    assert [os.stat(path).st_mtime_ns for path in paths] == modified
+    assert cache.version("demo") == version
+
+
+def test_changed_refresh_rewrites_only_changed_partitions(cache):
+    schedule = synthetic_schedule(residents=5, days=len(DAYS), start=START)
+    cache.write("demo", DAYS, schedule)
+    version = cache.version("demo")
+    first_day = schedule["date"] == START.strftime("%m-%d-%y")
+    changed_name = schedule[first_day]["name"].iloc[0]
+    schedule.loc[first_day & (schedule["name"] == changed_name), "end_time"] = "2300"
+    paths = [cache.partition_path("demo", day) for day in DAYS]
+    modified = [os.stat(path).st_mtime_ns for path in paths]
+
+    assert cache.write("demo", DAYS, schedule) == {changed_name}
+
+    assert [os.stat(path).st_mtime_ns == before for path, before in zip(paths, modified)] == [
+        False
+    ] + [True] * (len(DAYS) - 1)
+    assert cache.version("demo") != version
+
+
+def test_partitions_without_markers_use_their_modified_time(cache):
+    cache.write("demo", DAYS, synthetic_schedule(residents=5, days=len(DAYS), start=START))
+    path = cache.partition_path("demo", DAYS[0])
+    os.remove(f"{path}{FETCHED_SUFFIX}")
+
+    assert cache.fetched_at(path) == os.stat(path).st_mtime
+    assert cache.prune("demo") == []
+    assert cache.prune("demo", expired_only=False) != []
+    assert sorted(os.listdir(cache.login_dir("demo"))) == []
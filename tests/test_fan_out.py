@@ -0,0 +1,71 @@
+import datetime as dt
+import time
+
+from benchmarks.fixtures import synthetic_schedule
+from defaults.constants import Constants
+from etl.utils import get_schedule_store
+
+LATENCY = 0.5
+
+
+def test_combined_access_code_fetches_concurrently_and_merges(stand_in, amion_env):
+    start = dt.date(2023, 8, 1)
+    program_a = synthetic_schedule(residents=8, days=14, start=start, seed=1)
+    program_b = synthetic_schedule(residents=8, days=14, start=start, seed=2)
+    # Different people in each program, except one resident working in both
+    both = program_a["name"].iloc[0]
+    program_b["name"] = "B " + program_b["name"]
+    program_b.loc[program_b["name"] == program_b["name"].iloc[0], "name"] = both
+    server = stand_in({"a": program_a, "b": program_b}, latency=LATENCY)
+    amion_env(server.url)
+
+    started = time.perf_counter()
+    store = get_schedule_store(
+        login_code="a, b", start_year=start.year, start_month=start.month, start_day=1, days=14
+    )
+    elapsed = time.perf_counter() - started
+
+    # One request per program, answered at the same time rather than one after the other
+    assert len(server.requests) == 2
+    assert elapsed < 2 * LATENCY
+    assert set(store.names) == set(program_a["name"]) | set(program_b["name"])
+    single_stores = [
+        get_schedule_store(
+            login_code=code, start_year=start.year, start_month=start.month, start_day=1, days=14
+        )
+        for code in ["a", "b"]
+    ]
+    assert all(len(single.shifts(names=[both])) > 0 for single in single_stores)
+    assert len(store.shifts(names=[both])) == sum(
+        len(single.shifts(names=[both])) for single in single_stores
+    )
+    # The order of the access codes doesn't matter
+    assert (
+        get_schedule_store(
+            login_code="b,a", start_year=start.year, start_month=start.month, start_day=1, days=14
+        )
+        is store
+    )
+
+
+def test_nested_fan_out_stays_within_max_concurrency(stand_in, amion_env):
+    start = dt.date(2023, 8, 1)
+    days = 4 * Constants().amion_chunk_days
+    schedules = {
+        f"program{i}": synthetic_schedule(residents=4, days=days, start=start, seed=i)
+        for i in range(4)
+    }
+    server = stand_in(schedules, latency=0.1)
+    amion_env(server.url)
+
+    get_schedule_store(
+        login_code=",".join(schedules),
+        start_year=start.year,
+        start_month=start.month,
+        start_day=start.day,
+        days=days,
+    )
+
+    # 4 programs x 4 chunks of dates, fanned out inside each other
+    assert len(server.requests) == 16
+    assert server.max_in_flight == Constants().amion_max_concurrency
@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+from benchmarks.import_time import BUDGET_MS, HEAVY_MODULES, REPO_DIR, best_cold_start
+
+
+def test_home_page_is_served_within_budget_while_the_etl_preloads():
+    elapsed_ms, _, _ = best_cold_start()
+    assert elapsed_ms <= BUDGET_MS
+
+
+def test_home_page_does_not_load_the_analytics_stack():
+    elapsed_ms, heavy, _ = best_cold_start(preload=False)
+    assert heavy == []
+    assert elapsed_ms <= BUDGET_MS
+
+
+def test_saving_a_selection_does_not_load_the_analytics_stack(tmp_path):
+    script = (
+        "import sys, app\n"
+        "response = app.app.test_client().post('/api/v1/selections', json={"
+        "'access_code': 'demo', 'names': ['Kim, Casey'],"
+        "'start_date': '2023-08-01', 'end_date': '2023-08-15'})\n"
+        "assert response.status_code == 201, response.data\n"
+        "print(','.join(name for name in HEAVY_MODULES if name in sys.modules))\n"
+    )
+    env = dict(os.environ, PREFETCH_ENABLED="0", PRELOAD_ETL="0", CACHE_DIR=str(tmp_path))
+    result = subprocess.run(
+        [sys.executable, "-c", f"HEAVY_MODULES = {HEAVY_MODULES!r}\n{script}"],
+        cwd=REPO_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == ""